@@ -0,0 +1,54 @@
+"""
+Benchmark de nettoyage.regroupement_marche_complet sur des données synthétiques.
+Le temps par ligne doit rester à peu près constant quand la taille double (complexité linéaire).
+
+A lancer depuis n'importe quel dossier:
+    python benchmarks/bench_regroupement_marche_complet.py [nb_lignes_max]
+"""
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# nettoyage lit ses fichiers de configuration relativement au dossier courant
+racine_projet = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(racine_projet)
+sys.path.insert(0, racine_projet)
+import nettoyage  # noqa: E402
+
+
+def creation_donnees(nb_lignes: int, graine: int = 20) -> pd.DataFrame:
+    """
+    Création d'un DataFrame synthétique: en moyenne 3 lignes (titulaires) par marché et 1% d'id manquants.
+
+    Retour:
+        pd.DataFrame
+    """
+    generateur = np.random.default_rng(graine)
+    nb_marches = max(nb_lignes // 3, 1)
+    marche = generateur.integers(0, nb_marches, nb_lignes)
+    ids = pd.array(generateur.integers(10 ** 9, 10 ** 10, nb_lignes).astype(str), dtype="string")
+    ids[generateur.random(nb_lignes) < 0.01] = pd.NA
+    return pd.DataFrame({
+        "objet": pd.array(np.char.add("Objet du marché ", (marche % 50000).astype(str)), dtype="string"),
+        "datePublicationDonnees": np.char.add("2020-01-", (marche % 28 + 1).astype(str)).astype(object),
+        "montant": (marche * 10 + 200).astype(np.float64),
+        "id": ids,
+    })
+
+
+def main():
+    nb_lignes_max = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    tailles = [nb_lignes_max // 8, nb_lignes_max // 4, nb_lignes_max // 2, nb_lignes_max]
+    print(f"{'lignes':>10} {'secondes':>10} {'µs/ligne':>10}")
+    for nb_lignes in tailles:
+        df = creation_donnees(nb_lignes)
+        debut = time.perf_counter()
+        nettoyage.regroupement_marche_complet(df)
+        duree = time.perf_counter() - debut
+        print(f"{nb_lignes:>10} {duree:>10.2f} {duree / nb_lignes * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 import csv
 import json
 import os
-import pickle
 import logging
+from functools import partial
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
+import incremental
+import sirene
+import utils
 from geopy.distance import distance, Point
 
 logger = logging.getLogger("main.enrichissement")
@@ -21,31 +25,69 @@ path_to_data = conf_data["path_to_data"]
 
 
 def main():
-    with open('df_nettoye', 'rb') as df_nettoye:
-        df = pickle.load(df_nettoye)
-
-    df = df.astype(conf_glob["enrichissement"]["type_col_enrichissement"], copy=False)
-    df = (df.pipe(enrichissement_siret)
-          .pipe(enrichissement_cpv)
-          .pipe(enrichissement_acheteur)
-          .pipe(reorganisation)
-          .pipe(enrichissement_geo)
-          .pipe(enrichissement_type_entreprise)
-          .pipe(apply_luhn)
-          .pipe(enrichissement_departement)
-          .pipe(enrichissement_arrondissement)
-          .pipe(manage_column_final)
-          .pipe(change_sources_name)
-          )
+    df = lecture_donnees_nettoyees("decp_nettoye.parquet")
+
+    # En exécution incrémentale, la colonne empreinteMarche permet la fusion avec les lignes de l'exécution précédente
+    colonnes_techniques = ["empreinteMarche"] if incremental.est_actif() else []
+    if df.empty:
+        logger.info("Aucun marché à enrichir")
+        df = pd.DataFrame(columns=colonnes_techniques)
+    else:
+        # Le Parquet conserve les types: seules les colonnes dont le type diffère sont converties. is_dtype_equal
+        # compare "category" à toute colonne catégorielle, quelles que soient ses modalités
+        type_col_enrichissement = {
+            col: type_col for col, type_col in conf_glob["enrichissement"]["type_col_enrichissement"].items()
+            if col in df.columns and not pd.api.types.is_dtype_equal(df[col].dtype, type_col)}
+        df = df.astype(type_col_enrichissement, copy=False)
+        etapes = [enrichissement_sirene,
+                  enrichissement_cpv,
+                  reorganisation,
+                  enrichissement_geo,
+                  enrichissement_type_entreprise,
+                  apply_luhn,
+                  enrichissement_departement,
+                  enrichissement_arrondissement,
+                  partial(manage_column_final, colonnes_techniques=colonnes_techniques),
+                  change_sources_name]
+        if conf_glob["optimisation_types"]["actif"]:
+            etapes += [partial(utils.optimisation_types, type_col=conf_glob["optimisation_types"]["type_col"])]
+        # Points de reprise (cf utils.execution_etapes_avec_reprise), identifiés par les fichiers d'entrée.
+        # decp_nettoye.parquet est réécrit à chaque exécution du nettoyage: c'est son contenu qui l'identifie.
+        fichiers_entree = [os.path.join(path_to_data, conf_data[key]) for key in conf_data
+                           if key not in ["path_to_project", "path_to_data"]]
+        # Les mises à jour de la base SIRENE sont des fichiers d'entrée au même titre que le stock
+        cle_initiale = (utils.signature_fichiers(["decp_nettoye.parquet"], empreinte_contenu=True)
+                        + utils.signature_fichiers(fichiers_entree + sirene.fichiers_mises_a_jour()))
+        df = utils.execution_etapes_avec_reprise(df, etapes, cle_initiale, conf_glob["points_de_reprise"],
+                                                 actif=not incremental.est_actif(),
+                                                 conf_rapport=conf_glob["rapport_performances"],
+                                                 nom_chaine="enrichissement")
+    if incremental.est_actif():
+        df = incremental.fusion_etat_precedent(df)
+        df = df.drop(columns=colonnes_techniques)
 
     logger.info("Début du traitement: Ecriture du csv final: decp_augmente")
     df.to_csv("decp_augmente.csv", quoting=csv.QUOTE_NONNUMERIC, sep=";")
     logger.info("Fin du traitement")
 
 
-def manage_column_final(df: pd.DataFrame) -> pd.DataFrame:
+def lecture_donnees_nettoyees(chemin: str) -> pd.DataFrame:
+    """
+    Lecture du fichier Parquet produit par nettoyage.py, en mémoire partagée (memory_map).
+    Seules les colonnes utiles à l'enrichissement sont lues: les colonnes xxxModification ne servent qu'au nettoyage.
+
+    Retour:
+        - pd.DataFrame
+    """
+    logger.info(f"Lecture du fichier {chemin}")
+    colonnes = [col for col in pq.read_schema(chemin).names if not col.endswith("Modification")]
+    return pd.read_parquet(chemin, columns=colonnes, memory_map=True)
+
+
+def manage_column_final(df: pd.DataFrame, colonnes_techniques: list = None) -> pd.DataFrame:
     """
     Renommage de certaines colonnes et trie des colonnes.
+    Les colonnes_techniques sont conservées en plus des colonnes à exporter.
 
     Retour:
         - pd.DataFrame
@@ -58,7 +100,7 @@ def manage_column_final(df: pd.DataFrame) -> pd.DataFrame:
     for key in conf_export["export"].keys():
         if conf_export["export"][key] == 1:
             colonne_to_export += [key]
-    df = df.reindex(columns=colonne_to_export)
+    df = df.reindex(columns=colonne_to_export + (colonnes_techniques or []))
     df = df.rename(columns={
         "natureObjet": "natureObjetMarche",
         "categorieEntreprise": "categorieEtablissement",
@@ -188,9 +230,39 @@ def get_libelle_arrondissement(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+# Attributs de StockUniteLegale ajoutés aux titulaires et aux acheteurs: {colonne de la base: (colonne titulaire,
+# colonne acheteur)}
+attributs_unite_legale = {
+    "categorieEntreprise": ("categorieEntreprise", "categorieEntrepriseAcheteur"),
+    "categorieJuridiqueUniteLegale": ("categorieJuridiqueEtablissement", "categorieJuridiqueAcheteur"),
+    "trancheEffectifsUniteLegale": ("trancheEffectifsEtablissement", "trancheEffectifsAcheteur"),
+    "activitePrincipaleUniteLegale": ("activitePrincipaleUniteLegaleEtablissement",
+                                      "activitePrincipaleUniteLegaleAcheteur")}
+
+
+def recherche_cles_triees(cles_triees: np.ndarray, valeurs: np.ndarray) -> tuple:
+    """
+    Recherche par dichotomie des valeurs dans un tableau de clefs triées et uniques
+
+    Retour:
+        tuple:
+            - np.ndarray: position de chaque valeur dans cles_triees
+            - np.ndarray de bool: valeur trouvée
+    """
+    positions = np.searchsorted(cles_triees, valeurs)
+    positions[positions == len(cles_triees)] = 0
+    trouve = cles_triees[positions] == valeurs if len(cles_triees) else np.zeros(len(valeurs), dtype=bool)
+    return positions, trouve
+
+
 def enrichissement_type_entreprise(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Enrichissement des données avec la catégorie de l'entreprise. Utilisation de la base StockUniteLegale de l'Insee
+    Enrichissement des titulaires et des acheteurs avec les attributs de leur unité légale (catégorie d'entreprise,
+    catégorie juridique, tranche d'effectifs, activité principale, cf attributs_unite_legale). Utilisation de la base
+    StockUniteLegale de l'Insee.
+    Comme auparavant, seuls les siret des sièges sont enrichis: la clef siret (cf
+    nettoyage.canonicalisation_identifiants) est comparée au siren * 100000 + nicSiegeUniteLegale de chaque unité
+    légale. Les attributs trouvés sont écrits dans des tableaux alloués une fois pour toutes les clefs recherchées.
 
     Retour:
         - pd.DataFrame
@@ -198,35 +270,41 @@ def enrichissement_type_entreprise(df: pd.DataFrame) -> pd.DataFrame:
     logger.info('début enrichissement_type_entreprise')
 
     df = df.astype(conf_glob["enrichissement"]["type_col_enrichissement_siret"], copy=False)
+    cles = np.union1d(df.cleSiretTitulaire.to_numpy(), df.cleSiretAcheteur.to_numpy())
+    cles = cles[cles > 0]
+    attributs = {col: np.full(len(cles), np.nan, dtype=object) for col in attributs_unite_legale}
+    deja_trouve = np.zeros(len(cles), dtype=bool)
     # Recuperation de la base
     path = os.path.join(path_to_data, conf_data["base_ajout_type_entreprise"])
     # La base est volumineuse. Pour "optimiser la mémoire", on va segmenter l'import
-    to_add = pd.DataFrame(columns=["siren", "categorieEntreprise"])
     chunksize = 1000000
     for to_add_chunk in pd.read_csv(
         path,
         chunksize=chunksize,
-        usecols=["siren", "categorieEntreprise", "nicSiegeUniteLegale"],
-        dtype={"siren": 'string', "categorieEntreprise": 'string', "nicSiegeUniteLegale": 'string'}
+        usecols=["siren", "nicSiegeUniteLegale"] + list(attributs_unite_legale),
+        dtype={"siren": np.uint64, "nicSiegeUniteLegale": np.float64, **{col: str for col in attributs_unite_legale}}
     ):
-        # On doit creer Siret
-        to_add_chunk["nicSiegeUniteLegale"] = to_add_chunk["nicSiegeUniteLegale"].astype(str).str.zfill(5)
-
-        #  À Partir d'ici le siren correspond à siretEtablissement
-        #  C'est la même colonne pour optimiser la mémoire
-        to_add_chunk["siren"] = to_add_chunk["siren"].astype(str).str\
-            .cat(to_add_chunk["nicSiegeUniteLegale"].astype(str), sep='')
-
-        # filtrer only existing siret
-        to_add = to_add.append(to_add_chunk[to_add_chunk['siren'].isin(df['siretEtablissement'])])
+        to_add_chunk = to_add_chunk[to_add_chunk.nicSiegeUniteLegale.notnull()]
+        # Siret du siège: siren * 100000 + nic
+        siret_siege = to_add_chunk.siren.to_numpy() * np.uint64(100000) \
+            + to_add_chunk.nicSiegeUniteLegale.to_numpy().astype(np.uint64)
+        positions, trouve = recherche_cles_triees(cles, siret_siege)
+        # En cas de doublon, la première unité légale lue est conservée
+        trouve[trouve] = ~deja_trouve[positions[trouve]]
+        for col in attributs_unite_legale:
+            attributs[col][positions[trouve]] = to_add_chunk[col].to_numpy()[trouve]
+        deja_trouve[positions[trouve]] = True
         del to_add_chunk
 
-    to_add.rename(columns={"siren": "siretEtablissement"}, inplace=True)
-    # # Jointure sur le Siret entre df et to_add
-    df = df.merge(
-        to_add[['categorieEntreprise', 'siretEtablissement']], how='left', on='siretEtablissement', copy=False)
+    # Jointure sur la clef siret des titulaires et des acheteurs
+    for role, cle in enumerate(["cleSiretTitulaire", "cleSiretAcheteur"]):
+        positions, trouve = recherche_cles_triees(cles, df[cle].to_numpy())
+        for col, colonnes_roles in attributs_unite_legale.items():
+            valeurs = np.full(len(df), np.nan, dtype=object)
+            valeurs[trouve] = attributs[col][positions[trouve]]
+            df[colonnes_roles[role]] = valeurs
+    logger.info(f"Unités légales trouvées pour {deja_trouve.sum()} siret sur {len(cles)}")
     df["categorieEntreprise"] = np.where(df["categorieEntreprise"].isnull(), "NC", df["categorieEntreprise"])
-    del to_add
     logger.info('fin enrichissement_type_entreprise\n')
     return df
 
@@ -299,19 +377,73 @@ def apply_luhn(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def enrichissement_siret(df: pd.DataFrame) -> pd.DataFrame:
+# Colonnes de StockEtablissement_utf8 utiles aux titulaires et aux acheteurs
+colonnes_etablissements_titulaires = [
+    'siren',
+    'nic',
+    'siret',
+    'typeVoieEtablissement',
+    'libelleVoieEtablissement',
+    'codePostalEtablissement',
+    'libelleCommuneEtablissement',
+    'codeCommuneEtablissement',
+    'activitePrincipaleEtablissement',
+    'nomenclatureActivitePrincipaleEtablissement']
+colonnes_etablissements_acheteurs = [
+    'siret',
+    'codePostalEtablissement',
+    'libelleCommuneEtablissement',
+    'codeCommuneEtablissement']
+
+
+def enrichissement_sirene(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Enrichissement des données via les codes siret/siren
+    Enrichissement des titulaires puis des acheteurs via la base StockEtablissement de l'Insee.
+    Les clefs siret des deux rôles (cf nettoyage.canonicalisation_identifiants) sont collectées au préalable et
+    recherchées en une fois (cf lecture_base_etablissements).
 
     Retour:
         - pd.DataFrame
     """
-    logger.info("Début du traitement: Enrichissement siret")
     dfSIRET = get_siretdf_from_original_data(df)
+    sirets = np.union1d(dfSIRET.siret.to_numpy(), df.cleSiretAcheteur.to_numpy())
+    etablissements = lecture_base_etablissements(sirets[sirets > 0])
+    df = enrichissement_siret(df, etablissements, dfSIRET)
+    df = enrichissement_acheteur(df, etablissements)
+    return df
+
+
+def lecture_base_etablissements(sirets: np.ndarray) -> pd.DataFrame:
+    """
+    Recherche des établissements dont le siret est dans sirets dans la base SIRENE indexée par siret (cf sirene.py),
+    reconstruite au préalable si StockEtablissement_utf8 a changé. Les colonnes renvoyées sont l'union de celles
+    utilisées pour les titulaires et les acheteurs.
+
+    Retour:
+        - pd.DataFrame
+    """
+    logger.info("Début du traitement: Recherche dans la base SIRENE des établissements")
+    sirene.mise_a_jour_base()
+    colonnes = list(dict.fromkeys(colonnes_etablissements_titulaires + colonnes_etablissements_acheteurs))
+    result = sirene.recherche_etablissements(sirets, colonnes)
+    logger.info(f"{len(result)} établissement(s) trouvé(s) sur {len(sirets)} siret recherché(s)")
+    return result
+
+
+def enrichissement_siret(df: pd.DataFrame, etablissements: pd.DataFrame, dfSIRET: pd.DataFrame) -> pd.DataFrame:
+    """
+    Enrichissement des données via les codes siret/siren.
+    etablissements est l'extrait de la base StockEtablissement (cf lecture_base_etablissements), dfSIRET les siret
+    uniques des titulaires (cf get_siretdf_from_original_data).
+
+    Retour:
+        - pd.DataFrame
+    """
+    logger.info("Début du traitement: Enrichissement siret")
     archiveErrorSIRET = getArchiveErrorSIRET()
 
     logger.info("Enrichissement insee en cours...")
-    enrichissementInsee, nanSiren = get_enrichissement_insee(dfSIRET, path_to_data)
+    enrichissementInsee, nanSiren = get_enrichissement_insee(dfSIRET, etablissements)
     logger.info("Enrichissement insee fini")
 
     logger.info("Enrichissement infogreffe en cours...")
@@ -326,32 +458,28 @@ def enrichissement_siret(df: pd.DataFrame) -> pd.DataFrame:
     logger.info("Fini")
 
     # Ajout au df principal
-    df = pd.merge(df, dfenrichissement, how='outer', left_on="idTitulaires", right_on="siret", copy=False)
+    df = pd.merge(df, dfenrichissement, how='outer', on="cleSiretTitulaire", copy=False)
     del dfenrichissement
     return df
 
 
 def get_siretdf_from_original_data(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Utilisation d'un dataframe intermediaire pour traiter les Siret unique
+    Utilisation d'un dataframe intermediaire pour traiter les Siret unique: clefs entières siret (uint64) et siren
+    (uint32) des titulaires, les identifiants invalides (clef 0) sont écartés
 
     Retour:
         - pd.DataFrame
     """
 
-    dfSIRET = pd.DataFrame.copy(df[['idTitulaires', 'typeIdentifiant', 'denominationSociale']])
-    dfSIRET = dfSIRET.drop_duplicates(subset=['idTitulaires'], keep='first')
-    dfSIRET.reset_index(inplace=True, drop=True)
-    dfSIRET.idTitulaires = dfSIRET.idTitulaires.astype(str)
-
-    dfSIRET["idTitulaires"] = np.where(~dfSIRET["idTitulaires"].str.isdigit(), '00000000000000', dfSIRET.idTitulaires)
-
+    dfSIRET = pd.DataFrame.copy(df[['cleSiretTitulaire', 'cleSirenTitulaire', 'denominationSociale']])
+    dfSIRET = dfSIRET[dfSIRET.cleSiretTitulaire > 0]
+    dfSIRET = dfSIRET.drop_duplicates(subset=['cleSiretTitulaire'], keep='first')
     dfSIRET.reset_index(inplace=True, drop=True)
 
     dfSIRET.rename(columns={
-        "idTitulaires": "siret",
-        "typeIdentifiant": "siren"}, inplace=True)
-    dfSIRET.siren = dfSIRET.siret.str[:9] # 9 = taille du Siren
+        "cleSiretTitulaire": "siret",
+        "cleSirenTitulaire": "siren"}, inplace=True)
     dfSIRET.denominationSociale = dfSIRET.denominationSociale.astype(str)
 
     return dfSIRET
@@ -369,9 +497,11 @@ def getArchiveErrorSIRET() -> pd.DataFrame:
     return archiveErrorSIRET
 
 
-def get_enrichissement_insee(dfSIRET: pd.DataFrame, path_to_data: str) -> list:
+def get_enrichissement_insee(dfSIRET: pd.DataFrame, etablissements: pd.DataFrame) -> list:
     """
-    Ajout des informations Adresse/Activité des entreprises via la base siren Insee
+    Ajout des informations Adresse/Activité des entreprises via la base siren Insee (extrait etablissements).
+    Pour les siret non trouvés, ce sont les informations du siège social de l'entreprise (même siren) qui sont
+    utilisées.
 
     Retour:
         - list:
@@ -379,33 +509,15 @@ def get_enrichissement_insee(dfSIRET: pd.DataFrame, path_to_data: str) -> list:
             - list[1]: pd.DataFrame -- données ou le SIRET n'est pas renseigné
     """
     # dans StockEtablissement_utf8, il y a principalement : siren, siret, nom établissement, adresse, activité principale
-    path = os.path.join(path_to_data, conf_data["base_sirene_insee"])
-    columns = [
-        'siren',
-        'nic',
-        'siret',
-        'typeVoieEtablissement',
-        'libelleVoieEtablissement',
-        'codePostalEtablissement',
-        'libelleCommuneEtablissement',
-        'codeCommuneEtablissement',
-        'activitePrincipaleEtablissement',
-        'nomenclatureActivitePrincipaleEtablissement']  # Colonne à utiliser dans la base Siren
     dtypes = {
-        'siret': 'string',
         'typeVoieEtablissement': 'string',
         'libelleVoieEtablissement': 'string',
         'codePostalEtablissement': 'string',
         'libelleCommuneEtablissement': 'string',
     }
 
-    result = pd.DataFrame(columns=columns)
-    chunksize = 1000000
-    for gm_chunk in pd.read_csv(path, chunksize=chunksize, sep=',', encoding='utf-8', usecols=columns, dtype=dtypes):
-        resultTemp = pd.merge(dfSIRET['siret'], gm_chunk, on=['siret'], copy=False)
-        result = pd.concat([result, resultTemp], axis=0, copy=False)
-        del resultTemp
-    result = result.drop_duplicates(subset=['siret'], keep='first')
+    result = etablissements[colonnes_etablissements_titulaires].astype(dtypes)
+    result = pd.merge(dfSIRET['siret'], result, on=['siret'], copy=False)
 
     enrichissement_insee_siret = pd.merge(dfSIRET, result, how='outer', on=['siret'], copy=False)
     enrichissement_insee_siret.rename(columns={"siren_x": "siren"}, inplace=True)
@@ -418,10 +530,17 @@ def get_enrichissement_insee(dfSIRET: pd.DataFrame, path_to_data: str) -> list:
     # Concaténation des deux resultats
     enrichissementInsee = enrichissement_insee_siret
 
-    temp_df = pd.merge(nanSiret, result, indicator=True, how="outer", on='siren', copy=False)
+    # Siret non trouvés: recherche du siège social de l'entreprise via l'index sur le siren. Les informations du
+    # siège sont rattachées au siret du titulaire
     del result
-    nanSiret = temp_df[temp_df['activitePrincipaleEtablissement'].isnull()]
-    nanSiret = nanSiret.iloc[:, :3]
+    sieges = sirene.recherche_sieges(nanSiret.siren.unique(), colonnes_etablissements_titulaires).astype(dtypes)
+    sieges = sieges.drop(columns=["siret"]).drop_duplicates(subset=["siren"], keep="first")
+    temp_df = pd.merge(nanSiret, sieges, how="left", on='siren', copy=False)
+    del sieges
+    siege_trouve = temp_df['activitePrincipaleEtablissement'].notnull()
+    logger.info(f"Siret non trouvés: {siege_trouve.sum()} rattaché(s) au siège de leur entreprise sur {len(temp_df)}")
+    enrichissementInsee = pd.concat([enrichissementInsee, temp_df[siege_trouve]], ignore_index=True, copy=False)
+    nanSiret = temp_df.loc[~siege_trouve, ["siret", "siren", "denominationSociale"]]
     nanSiret.reset_index(inplace=True, drop=True)
 
     return [enrichissementInsee, nanSiret]
@@ -536,7 +655,12 @@ def get_df_enrichissement(enrichissementScrap: pd.DataFrame, enrichissementInsee
         'rue': 'adresseEtablissement'
     }, inplace=True, errors="ignore")
 
+    # La clef entière sert à la jointure avec le df principal, siret et siren sont exportés en texte
+    enrichissementInsee['cleSiretTitulaire'] = enrichissementInsee.siret
+    enrichissementInsee['siret'] = enrichissementInsee.siret.map('{:014d}'.format)
+    enrichissementInsee['siren'] = enrichissementInsee.siren.map('{:09d}'.format)
     enrichissementInsee = enrichissementInsee[[
+        'cleSiretTitulaire',
         'siret',
         'siren',
         'denominationSociale',
@@ -548,7 +672,10 @@ def get_df_enrichissement(enrichissementScrap: pd.DataFrame, enrichissementInsee
 
     # df final pour enrichir les données des entreprises
     dfenrichissement = pd.concat([enrichissementInsee, enrichissementScrap], copy=False)
-    dfenrichissement = dfenrichissement.astype(str)
+    # Les résultats sans siret ne peuvent pas être rattachés aux titulaires
+    dfenrichissement = dfenrichissement[dfenrichissement.cleSiretTitulaire.notnull()]
+    dfenrichissement = dfenrichissement.astype({col: np.uint64 if col == 'cleSiretTitulaire' else str
+                                                for col in dfenrichissement.columns})
     # On s'assure qu'il n'y ai pas de doublons
     dfenrichissement = dfenrichissement.drop_duplicates(subset=['siret'], keep=False)
 
@@ -587,38 +714,27 @@ def enrichissement_cpv(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def enrichissement_acheteur(df: pd.DataFrame) -> pd.DataFrame:
+def enrichissement_acheteur(df: pd.DataFrame, etablissements: pd.DataFrame) -> pd.DataFrame:
     """
-    Enrichissement des données des acheteurs via les codes siret/siren
+    Enrichissement des données des acheteurs via les codes siret/siren.
+    etablissements est l'extrait de la base StockEtablissement (cf lecture_base_etablissements).
 
     Return:
         - pd.DataFrame
     """
     logger.info("Début du traitement: Enrichissement acheteur")
-    dfAcheteurId = df['acheteur.id'].to_frame()
+    dfAcheteurId = df['cleSiretAcheteur'].to_frame()
     dfAcheteurId.columns = ['siret']
-    dfAcheteurId = dfAcheteurId.drop_duplicates(keep='first')
+    dfAcheteurId = dfAcheteurId[dfAcheteurId.siret > 0].drop_duplicates(keep='first')
     dfAcheteurId.reset_index(inplace=True, drop=True)
-    dfAcheteurId = dfAcheteurId.astype(str)
-
-    # StockEtablissement_utf8
-    chemin = os.path.join(path_to_data, conf_data["base_sirene_insee"])
-    # chemin = 'dataEnrichissement/StockEtablissement_utf8.csv'
-    result = pd.DataFrame(columns=['siret', 'codePostalEtablissement',
-                                   'libelleCommuneEtablissement', 'codeCommuneEtablissement'])
-    for gm_chunk in pd.read_csv(
-            chemin, chunksize=1000000, sep=',', encoding='utf-8',
-            usecols=['siret', 'codePostalEtablissement', 'libelleCommuneEtablissement', 'codeCommuneEtablissement']):
-        gm_chunk['siret'] = gm_chunk['siret'].astype(str)
-        resultTemp = pd.merge(dfAcheteurId, gm_chunk, on="siret", copy=False)
-        result = pd.concat([result, resultTemp], axis=0, copy=False)
-    result = result.drop_duplicates(subset=['siret'], keep='first')
-    enrichissementAcheteur = result
-    enrichissementAcheteur.columns = ['acheteur.id', 'codePostalAcheteur', 'libelleCommuneAcheteur',
+
+    enrichissementAcheteur = pd.merge(dfAcheteurId, etablissements[colonnes_etablissements_acheteurs], on="siret",
+                                      copy=False)
+    enrichissementAcheteur.columns = ['cleSiretAcheteur', 'codePostalAcheteur', 'libelleCommuneAcheteur',
                                       'codeCommuneAcheteur']
-    enrichissementAcheteur = enrichissementAcheteur.drop_duplicates(subset=['acheteur.id'], keep='first')
+    enrichissementAcheteur = enrichissementAcheteur.drop_duplicates(subset=['cleSiretAcheteur'], keep='first')
 
-    df = pd.merge(df, enrichissementAcheteur, how='left', on='acheteur.id', copy=False)
+    df = pd.merge(df, enrichissementAcheteur, how='left', on='cleSiretAcheteur', copy=False)
     del enrichissementAcheteur
     return df
 
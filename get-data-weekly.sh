@@ -11,8 +11,15 @@ wget https://www.insee.fr/fr/statistiques/fichier/5057840/commune2021-csv.zip
 unzip commune2021-csv.zip
 wget https://www.insee.fr/fr/statistiques/fichier/5057840/arrondissement2021-csv.zip
 unzip arrondissement2021-csv.zip
-wget https://files.data.gouv.fr/insee-sirene/StockEtablissement_utf8.zip
-unzip StockEtablissement_utf8.zip
+# Le stock des établissements n'est téléchargé que si la base SIRENE (cf sirene.py) n'existe pas encore au format
+# attendu ou si SIRENE_STOCK_COMPLET est renseignée: sinon les fichiers de mise à jour déposés dans
+# data/sirene_mises_a_jour suffisent
+mkdir -p sirene_mises_a_jour
+if ! (cd .. && python -c "import sirene, sys; sys.exit(0 if sirene.base_utilisable() else 1)") \
+        || [ -n "$SIRENE_STOCK_COMPLET" ]; then
+    wget https://files.data.gouv.fr/insee-sirene/StockEtablissement_utf8.zip
+    unzip StockEtablissement_utf8.zip
+fi
 wget https://static.data.gouv.fr/resources/base-sirene-des-entreprises-et-de-leurs-etablissements-siren-siret/20210301/StockUniteLegale_utf8.zip
 unzip StockUniteLegale_utf8.zip
 # Supprimer les archives que l'on a extraite
@@ -0,0 +1,231 @@
+import json
+import os
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+import utils
+
+with open(os.path.join("confs", "var_glob.json")) as f:
+    conf_glob = json.load(f)
+conf_incremental = conf_glob["incremental"]
+dossier_etat = conf_incremental["dossier_etat"]
+
+logger = logging.getLogger("main.incremental")
+logger.setLevel(logging.DEBUG)
+
+# Etat validé par la dernière exécution complète (nettoyage + enrichissement):
+# empreintes des marchés traités ({empreinte: uid}) et lignes de decp_augmente correspondantes
+fichier_empreintes = os.path.join(dossier_etat, "empreintes.json")
+fichier_lignes = os.path.join(dossier_etat, "decp_augmente.parquet")
+# Empreintes des lignes retenues après suppression des doublons ({empreinteLigne: empreinteMarche}), cf nettoyage
+fichier_empreintes_lignes = os.path.join(dossier_etat, "empreintes_lignes.parquet")
+# Empreintes de l'exécution en cours, validées à la fin de l'enrichissement
+fichier_empreintes_en_cours = os.path.join(dossier_etat, "empreintes_en_cours.json")
+fichier_empreintes_lignes_en_cours = os.path.join(dossier_etat, "empreintes_lignes_en_cours.parquet")
+# Premier identifiant technique libre (cf nettoyage.indice_marche_avec_modification), et celui de l'exécution en cours
+fichier_id_technique = os.path.join(dossier_etat, "id_technique.json")
+fichier_id_technique_en_cours = os.path.join(dossier_etat, "id_technique_en_cours.json")
+
+
+def est_actif() -> bool:
+    """
+    Indique si les exécutions sont incrémentales (clef incremental.actif de var_glob.json)
+    """
+    return conf_incremental["actif"]
+
+
+def lecture_json(chemin: str) -> dict:
+    """
+    Lecture d'un fichier d'état json. Renvoie un dictionnaire vide si le fichier n'existe pas (première exécution)
+
+    Retour:
+        dict
+    """
+    if not os.path.exists(chemin):
+        return {}
+    with open(chemin, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def ecriture_json(contenu: dict, chemin: str):
+    """
+    Ecriture d'un fichier d'état json, via un fichier temporaire pour ne jamais laisser un état à moitié écrit
+    """
+    os.makedirs(dossier_etat, exist_ok=True)
+    with open(chemin + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(contenu, f)
+    os.replace(chemin + ".tmp", chemin)
+
+
+def lecture_empreintes() -> dict:
+    """
+    Empreintes des marchés de la dernière exécution validée ({empreinte: uid}). Sans les lignes correspondantes
+    (première exécution, état incomplet ou à un ancien format), l'état est ignoré et tous les marchés sont traités.
+
+    Retour:
+        dict
+    """
+    if not os.path.exists(fichier_lignes):
+        return {}
+    return lecture_json(fichier_empreintes)
+
+
+def uid_marche(marche: dict) -> str:
+    """
+    Identifiant d'un marché: son uid s'il est renseigné, sinon l'id de l'acheteur (ou de l'autorité concédante)
+    concaténé à l'id du marché, comme le construit decp-rama. Utilisé pour suivre les marchés supprimés.
+
+    Retour:
+        str
+    """
+    if marche.get("uid"):
+        return str(marche["uid"])
+    acheteur = marche.get("acheteur") or marche.get("autoriteConcedante") or {}
+    if not isinstance(acheteur, dict):
+        acheteur = {}
+    return f"{acheteur.get('id', '')}{marche.get('id', '')}"
+
+
+def empreinte_marche(marche: dict) -> str:
+    """
+    Empreinte du contenu d'un marché, indépendante de l'ordre des clefs du json
+
+    Retour:
+        str
+    """
+    contenu = json.dumps(marche, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(contenu.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def filtre_marches_modifies(lots):
+    """
+    Ne renvoie, lot par lot, que les marchés nouveaux ou modifiés depuis la dernière exécution validée, c'est à dire
+    dont l'empreinte n'est pas connue. La colonne empreinteMarche de chaque marché est renseignée pour permettre la
+    fusion finale.
+    Une fois les lots parcourus, les empreintes de tous les marchés du fichier (associées à leur uid) sont écrites dans
+    empreintes_en_cours.json. Elles ne deviennent l'état de référence qu'à la fin de l'enrichissement
+    (cf fusion_etat_precedent).
+    Les regroupements (regroupement_marche_complet, manage_duplicates) ne portent alors que sur les marchés traités.
+
+    Retour:
+        - generator de list
+    """
+    empreintes_precedentes = lecture_empreintes()
+    empreintes = {}
+    nb_marches = 0
+    nb_modifies = 0
+    for marches in lots:
+        marches_modifies = []
+        for marche in marches:
+            if not isinstance(marche, dict):
+                # Marché mal formé: transmis pour être mis en quarantaine (cf nettoyage.creation_colonnes_typees)
+                marches_modifies += [marche]
+                continue
+            empreinte = empreinte_marche(marche)
+            empreintes[empreinte] = uid_marche(marche)
+            if empreinte not in empreintes_precedentes:
+                marche["empreinteMarche"] = empreinte
+                marches_modifies += [marche]
+        nb_marches += len(marches)
+        nb_modifies += len(marches_modifies)
+        yield marches_modifies
+    uid_courants = set(empreintes.values())
+    nb_supprimes = len(set(empreintes_precedentes.values()) - uid_courants)
+    logger.info(f"Exécution incrémentale: {nb_modifies} marché(s) nouveau(x) ou modifié(s) sur {nb_marches}, "
+                f"{nb_supprimes} marché(s) supprimé(s) depuis la dernière exécution")
+    ecriture_json(empreintes, fichier_empreintes_en_cours)
+
+
+def empreintes_lignes_valides() -> pd.DataFrame:
+    """
+    Empreintes des lignes de la dernière exécution validée dont le marché est inchangé dans l'exécution en cours
+    (le marché d'une ligne est identifié par la colonne empreinteMarche). Les lignes des marchés modifiés ou supprimés
+    ne sont plus dans l'état final: elles ne doivent plus écarter de doublons.
+
+    Retour:
+        pd.DataFrame
+    """
+    if not os.path.exists(fichier_empreintes_lignes):
+        return pd.DataFrame({"empreinteLigne": np.array([], dtype=np.uint64), "empreinteMarche": []})
+    empreintes_lignes = pd.read_parquet(fichier_empreintes_lignes)
+    empreintes_inchangees = lecture_empreintes().keys() & lecture_json(fichier_empreintes_en_cours).keys()
+    return empreintes_lignes[empreintes_lignes.empreinteMarche.isin(empreintes_inchangees)]
+
+
+def filtre_lignes_connues(empreintes_lignes: pd.Series) -> np.ndarray:
+    """
+    Indique les lignes doublons d'une ligne déjà retenue lors de la dernière exécution validée, c'est à dire dont
+    l'empreinte (cf nettoyage.calcul_empreinte_ligne) est connue. Ces lignes sont dans l'état précédent repris lors de
+    la fusion finale: elles sont supprimées avant les étapes coûteuses.
+
+    Retour:
+        np.ndarray de bool
+    """
+    return empreintes_lignes.isin(empreintes_lignes_valides().empreinteLigne).to_numpy()
+
+
+def enregistrement_empreintes_lignes(df: pd.DataFrame):
+    """
+    Ecriture dans empreintes_lignes_en_cours.parquet des empreintes des lignes retenues par l'exécution en cours
+    (colonnes empreinteLigne et empreinteMarche), avec celles de l'exécution précédente encore valides. Elles ne
+    deviennent l'état de référence qu'à la fin de l'enrichissement (cf fusion_etat_precedent).
+    """
+    empreintes_lignes = pd.concat([empreintes_lignes_valides(), df], ignore_index=True)
+    os.makedirs(dossier_etat, exist_ok=True)
+    empreintes_lignes.to_parquet(fichier_empreintes_lignes_en_cours, index=False)
+
+
+def premier_id_technique() -> int:
+    """
+    Premier identifiant technique à attribuer aux marchés de l'exécution en cours: les identifiants techniques (et donc
+    les idMarche) des lignes reprises de l'état précédent ne sont jamais réattribués.
+
+    Retour:
+        int
+    """
+    return lecture_json(fichier_id_technique).get("prochain", 0)
+
+
+def enregistrement_id_technique(prochain: int):
+    """
+    Ecriture dans id_technique_en_cours.json du premier identifiant technique non attribué par l'exécution en cours.
+    Il ne devient l'état de référence qu'à la fin de l'enrichissement (cf fusion_etat_precedent).
+    """
+    ecriture_json({"prochain": prochain}, fichier_id_technique_en_cours)
+
+
+def fusion_etat_precedent(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Fusionne les lignes enrichies de l'exécution en cours (colonne empreinteMarche obligatoire) avec celles de la
+    dernière exécution validée: les lignes des marchés inchangés sont reprises, celles des anciennes versions des
+    marchés modifiés ou des marchés supprimés sont abandonnées. Le résultat devient le nouvel état de référence,
+    enregistré au format Parquet (cf utils.ecriture_parquet).
+
+    Retour:
+        pd.DataFrame
+    """
+    empreintes_precedentes = lecture_empreintes()
+    empreintes = lecture_json(fichier_empreintes_en_cours)
+    empreintes_inchangees = [empreinte for empreinte in empreintes if empreinte in empreintes_precedentes]
+    if os.path.exists(fichier_lignes):
+        lignes_precedentes = pd.read_parquet(fichier_lignes)
+        lignes_precedentes = lignes_precedentes[lignes_precedentes.empreinteMarche.isin(empreintes_inchangees)]
+        if df.empty:
+            # Aucun marché traité: le df vide ne doit pas modifier les types des lignes reprises
+            df = lignes_precedentes.reset_index(drop=True)
+        else:
+            df = pd.concat([lignes_precedentes, df], ignore_index=True, copy=False)
+    logger.info(f"Exécution incrémentale: {len(df)} lignes après fusion avec l'état précédent")
+
+    # Validation du nouvel état: les lignes d'abord, les empreintes ensuite
+    os.makedirs(dossier_etat, exist_ok=True)
+    utils.ecriture_parquet(df, fichier_lignes + ".tmp")
+    os.replace(fichier_lignes + ".tmp", fichier_lignes)
+    if os.path.exists(fichier_empreintes_lignes_en_cours):
+        os.replace(fichier_empreintes_lignes_en_cours, fichier_empreintes_lignes)
+    if os.path.exists(fichier_id_technique_en_cours):
+        os.replace(fichier_id_technique_en_cours, fichier_id_technique)
+    ecriture_json(empreintes, fichier_empreintes)
+    os.remove(fichier_empreintes_en_cours)
+    return df
@@ -1,11 +1,16 @@
 import json
 import os
-import pickle
+import re
 import logging.handlers
-from random import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from itertools import chain
+import random
 import numpy as np
 import pandas as pd
-from pandas import json_normalize
+import incremental
+import sirene
+import utils
 pd.options.mode.chained_assignment = None  # default='warn'
 
 with open(os.path.join("confs", "config_data.json")) as f:
@@ -22,54 +27,306 @@ logger.setLevel(logging.DEBUG)
 
 def main():
     check_reference_files()
+    nb_processus = conf_glob["nettoyage"]["nb_processus"]
+    if nb_processus > 1:
+        # Les étapes locales à chaque ligne sont exécutées en parallèle sur des partitions du df.
+        # manage_duplicates, data_inputation (médiane par CPV) et normalisation_texte (valeurs distinctes)
+        # portent sur l'ensemble des lignes: elles sont appliquées au df complet entre deux exécutions parallèles.
+        logger.info(f"Exécution parallèle sur {nb_processus} processus")
+        nb_partitions = conf_glob["nettoyage"]["nb_partitions"] or nb_processus
+        etapes = [partial(execution_partitionnee, etapes=[manage_titulaires, calcul_empreinte_ligne],
+                          nb_processus=nb_processus, nb_partitions=nb_partitions),
+                  manage_duplicates,
+                  partial(execution_partitionnee, etapes=[manage_amount, manage_missing_code,
+                                                          canonicalisation_identifiants, manage_region,
+                                                          manage_date, correct_date],
+                          nb_processus=nb_processus, nb_partitions=nb_partitions),
+                  data_inputation,
+                  normalisation_texte]
+    else:
+        etapes = [manage_titulaires, calcul_empreinte_ligne, manage_duplicates, manage_amount, manage_missing_code,
+                  canonicalisation_identifiants, manage_region, manage_date, correct_date, data_inputation,
+                  normalisation_texte]
+    etapes = [lecture_donnees, regroupement_marche_complet, optimisation_types] + etapes + [optimisation_types]
+
+    # Points de reprise: une relance reprend après la dernière étape déjà calculée avec les mêmes fichiers d'entrée,
+    # le même code et la même configuration. Ils sont désactivés en exécution incrémentale: la lecture des données
+    # prépare l'état incrémental et ne peut pas être sautée.
+    fichiers_entree = [os.path.join(path_to_data, conf_data[key]) for key in conf_data
+                       if key not in ["path_to_project", "path_to_data"]]
+    # Les performances de chaque étape sont écrites dans un rapport json (clef rapport_performances)
+    df = utils.execution_etapes_avec_reprise(None, etapes, utils.signature_fichiers(fichiers_entree),
+                                             conf_glob["points_de_reprise"], actif=not incremental.est_actif(),
+                                             conf_rapport=conf_glob["rapport_performances"],
+                                             nom_chaine="nettoyage")
+    if df.empty:
+        logger.info("Aucun marché à traiter")
+        utils.ecriture_parquet(df, "decp_nettoye.parquet")
+        return
+
+    logger.info("Creation du fichier intermédiaire: decp_nettoye.parquet")
+    # Export utilisé par le module enrichissement.py, les types des colonnes sont conservés
+    utils.ecriture_parquet(df, "decp_nettoye.parquet")
+    if conf_glob["nettoyage"]["export_csv_intermediaire"]:
+        df.to_csv("decp_nettoye.csv")
+    logger.info("Ecriture terminée")
+
+
+def lecture_donnees(df: pd.DataFrame = None) -> pd.DataFrame:
+    """
+    Première étape du nettoyage: lecture du fichier decp.json, échantillonnage ou filtre incrémental éventuels, et
+    conversion en pandas. Le df en entrée n'est pas utilisé.
+
+    Retour:
+        pd.DataFrame
+    """
     logger.info("Ouverture du fichier decp.json")
-    with open(os.path.join(path_to_data, decp_file_name), encoding='utf-8') as json_data:
-        data = json.load(json_data)
+    lots = lecture_marches(os.path.join(path_to_data, decp_file_name))
 
-    # Modification pour un prendre subset de données 
-    subset = True
-    if subset :
-        n_data = len(data["marches"])
-        n_subset = 15000
-        logger.info("Subset étant True on se restreint à un dataframe de taille n_subset soit  {} lignes choisis aléatoirement".format(n_subset))
-        debug = True # Pour debug on ne va évidemment pas prendre de l'aléatoire
-        if debug :
-            logger.info("Mode debug, pas d'alea")
-            seed = 20
-            np.random.seed(seed)
-            random_i = list(np.random.choice(n_data, n_subset))
-        else :
-            random_i = list(np.random.choice(n_data, n_subset))
-        accessed_mapping = map(data['marches'].__getitem__, random_i)
-        accessed_list = list(accessed_mapping)
-        data['marches'] = accessed_list
+    # Mode développement: on ne traite qu'un échantillon des marchés (cf var_glob.json)
+    conf_echantillonnage = conf_glob["nettoyage"]["echantillonnage"]
+    if conf_echantillonnage["actif"]:
+        lots = echantillonnage_marches(lots, conf_echantillonnage["fraction"], conf_echantillonnage["nombre"],
+                                       conf_echantillonnage["strate"], conf_echantillonnage["graine"])
 
+    # Exécution incrémentale: seuls les marchés nouveaux ou modifiés depuis la dernière exécution sont traités
+    if incremental.est_actif():
+        if conf_echantillonnage["actif"]:
+            raise ValueError("L'échantillonnage et l'exécution incrémentale ne peuvent pas être activés ensemble")
+        lots = incremental.filtre_marches_modifies(lots)
 
     logger.info("Début du traitement: Conversion des données en pandas")
-    df = manage_modifications(data)
+    df = manage_modifications(lots)
     logger.info("Fin du traitement")
+    return df
+
 
-    df = regroupement_marche_complet(df)
-
-    logger.info("Début du traitement: Gestion des titulaires")
-    df = (df.pipe(manage_titulaires)
-          .pipe(manage_duplicates)
-          .pipe(manage_amount)
-          .pipe(manage_missing_code)
-          .pipe(manage_region)
-          .pipe(manage_date)
-          .pipe(correct_date)
-          .pipe(data_inputation)
-          .pipe(replace_char)
-          )
+def execution_etapes(df: pd.DataFrame, etapes: list) -> pd.DataFrame:
+    """
+    Applique successivement les étapes (fonctions DataFrame -> DataFrame) au df, comme une chaîne de df.pipe
+
+    Retour:
+        pd.DataFrame
+    """
+    for etape in etapes:
+        df = etape(df)
+    return df
+
+
+def optimisation_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Conversion des colonnes en types moins coûteux en mémoire (catégories, booléens, entiers réduits) selon la clef
+    optimisation_types de var_glob.json. Appliquée après la conversion en pandas et en fin de nettoyage.
+
+    Retour:
+        pd.DataFrame
+    """
+    if not conf_glob["optimisation_types"]["actif"]:
+        return df
+    logger.info("Début du traitement: Optimisation des types")
+    df = utils.optimisation_types(df, conf_glob["optimisation_types"]["type_col"])
     logger.info("Fin du traitement")
+    return df
+
 
-    logger.info("Creation csv intermédiaire: decp_nettoye.csv")
-    with open('df_nettoye', 'wb') as df_nettoye:
-        # Export présent pour faciliter l'utilisation du module enrichissement.py
-        pickle.dump(df, df_nettoye)
-    df.to_csv("decp_nettoye.csv")
-    logger.info("Ecriture du csv terminé")
+def execution_partitionnee(df: pd.DataFrame, etapes: list, nb_processus: int, nb_partitions: int) -> pd.DataFrame:
+    """
+    Découpe le df en nb_partitions blocs de lignes consécutives et leur applique les étapes dans un pool de
+    nb_processus processus. Les étapes doivent être locales aux lignes: le résultat est alors identique à une
+    exécution sur le df complet. Les partitions sont recollées dans l'ordre d'origine.
+
+    Retour:
+        pd.DataFrame
+    """
+    bornes = np.linspace(0, len(df), nb_partitions + 1).astype(int)
+    partitions = [df.iloc[debut:fin] for debut, fin in zip(bornes[:-1], bornes[1:]) if fin > debut]
+    if len(partitions) <= 1:
+        return execution_etapes(df, etapes)
+    with ProcessPoolExecutor(max_workers=nb_processus) as executeur:
+        resultats = list(executeur.map(execution_etapes, partitions, [etapes] * len(partitions)))
+    return pd.concat(resultats, ignore_index=True, copy=False)
+
+
+def lecture_marches(chemin: str):
+    """
+    Renvoie un itérable de lots (listes) de marchés contenus dans le fichier decp.json.
+    Si lecture_incrementale vaut true dans var_glob.json, le fichier est parcouru au fil de l'eau (cf iter_marches),
+    sinon il est chargé en entier avec json.load.
+
+    Retour:
+        - iterable de list
+    """
+    conf_lecture = conf_glob["nettoyage"]
+    if conf_lecture["lecture_incrementale"]:
+        logger.info(f"Lecture incrémentale du fichier par lots de {conf_lecture['taille_lot_lecture']} marchés")
+        return iter_marches(chemin, conf_lecture["taille_lot_lecture"])
+    with open(chemin, encoding='utf-8') as json_data:
+        data = json.load(json_data)
+    return [data["marches"]]
+
+
+def iter_marches(chemin: str, taille_lot: int = 50000, taille_lecture: int = 2 ** 20):
+    """
+    Parcours incrémental du tableau "marches" du fichier decp.json.
+    Le fichier est lu par blocs de taille_lecture caractères, chaque marché est décodé dès qu'il est complet dans le
+    tampon, et les marchés sont renvoyés par lots de taille_lot. La mémoire utilisée ne dépend donc que de la taille
+    d'un lot et non de la taille du fichier.
+
+    Retour:
+        - generator de list
+    """
+    decodeur = json.JSONDecoder()
+    fin_nombre = re.compile(r"[\s,\]}]")
+    with open(chemin, encoding='utf-8') as fichier:
+        tampon = ""
+        position = 0
+
+        def completer_tampon() -> bool:
+            # On oublie la partie déjà décodée du tampon avant de lire le bloc suivant
+            nonlocal tampon, position
+            bloc = fichier.read(taille_lecture)
+            tampon = tampon[position:] + bloc
+            position = 0
+            return bool(bloc)
+
+        def caractere_suivant() -> str:
+            # Renvoie le prochain caractère non blanc, sans le consommer
+            nonlocal position
+            while True:
+                while position < len(tampon) and tampon[position] in " \t\n\r":
+                    position += 1
+                if position < len(tampon):
+                    return tampon[position]
+                if not completer_tampon():
+                    raise ValueError(f"Fin inattendue du fichier {chemin}")
+
+        def consommer(attendu: str):
+            nonlocal position
+            caractere = caractere_suivant()
+            if caractere != attendu:
+                raise ValueError(f"Caractère '{attendu}' attendu dans {chemin}, '{caractere}' trouvé")
+            position += 1
+
+        def decoder_valeur():
+            # Décode la valeur json qui commence à position, en complétant le tampon tant qu'elle est tronquée.
+            # Un nombre tronqué peut être décodé sans erreur: on s'assure qu'il est suivi d'un délimiteur.
+            nonlocal position
+            if caractere_suivant() in "-0123456789":
+                while not fin_nombre.search(tampon, position) and completer_tampon():
+                    pass
+            while True:
+                try:
+                    valeur, fin = decodeur.raw_decode(tampon, position)
+                except json.JSONDecodeError:
+                    if completer_tampon():
+                        continue
+                    raise
+                position = fin
+                return valeur
+
+        lot = []
+        consommer("{")
+        while caractere_suivant() != "}":
+            if caractere_suivant() == ",":
+                consommer(",")
+            cle = decoder_valeur()
+            consommer(":")
+            if cle != "marches":
+                decoder_valeur()
+                continue
+            consommer("[")
+            while caractere_suivant() != "]":
+                if caractere_suivant() == ",":
+                    consommer(",")
+                lot.append(decoder_valeur())
+                if len(lot) >= taille_lot:
+                    yield lot
+                    lot = []
+            consommer("]")
+        if lot:
+            yield lot
+
+
+def echantillonnage_marches(lots, fraction: float = None, nombre: int = None, strate: str = None,
+                            graine: int = None):
+    """
+    Echantillonnage des marchés au fil de la lecture, sans charger l'ensemble du fichier.
+        - fraction: chaque marché est conservé avec une probabilité fraction. L'échantillon est naturellement
+          proportionnel à chaque strate, les lots sont renvoyés au fur et à mesure.
+        - nombre: échantillonnage par réservoir de nombre marchés. Si strate est renseigné (ex: "source"), un
+          réservoir est tenu par modalité puis chaque strate est réduite à sa part de nombre au prorata de son effectif
+          (cf repartition_echantillon).
+          L'échantillon est renvoyé en un seul lot, dans l'ordre du fichier.
+    Avec une graine fixée, l'échantillon est reproductible.
+
+    Retour:
+        - generator de list
+    """
+    generateur = random.Random(graine)
+    if fraction is not None:
+        logger.info(f"Echantillonnage: conservation d'une fraction {fraction} des marchés (graine {graine})")
+        for marches in lots:
+            yield [marche for marche in marches if generateur.random() < fraction]
+        return
+    if nombre is None:
+        raise ValueError("L'échantillonnage nécessite une fraction ou un nombre de marchés")
+
+    logger.info(f"Echantillonnage: tirage de {nombre} marchés (strate: {strate}, graine {graine})")
+    reservoirs = {}
+    effectifs = {}
+    position = 0
+    for marches in lots:
+        for marche in marches:
+            modalite = marche.get(strate) if strate and isinstance(marche, dict) else None
+            reservoir = reservoirs.setdefault(modalite, [])
+            effectif = effectifs.get(modalite, 0)
+            # Algorithme R: le marché remplace un élément du réservoir avec une probabilité nombre / (effectif + 1)
+            if effectif < nombre:
+                reservoir += [(position, marche)]
+            else:
+                indice = generateur.randrange(effectif + 1)
+                if indice < nombre:
+                    reservoir[indice] = (position, marche)
+            effectifs[modalite] = effectif + 1
+            position += 1
+
+    parts = repartition_echantillon(effectifs, nombre)
+    echantillon = []
+    for modalite, reservoir in reservoirs.items():
+        part = parts[modalite]
+        if part < len(reservoir):
+            reservoir = generateur.sample(reservoir, part)
+        echantillon += reservoir
+        logger.info(f"Echantillonnage: {len(reservoir)} marché(s) conservé(s) sur {effectifs[modalite]} "
+                    f"pour la strate {modalite}")
+    echantillon.sort(key=lambda element: element[0])
+    yield [marche for _, marche in echantillon]
+
+
+def repartition_echantillon(effectifs: dict, nombre: int) -> dict:
+    """
+    Répartition de nombre marchés (au plus l'effectif total) entre les strates au prorata de leur effectif, par la
+    méthode du plus fort reste: la somme des parts est exactement la taille de l'échantillon. Chaque strate a au moins
+    un marché lorsque l'échantillon est assez grand pour toutes les représenter, la part prise en trop étant retirée
+    aux strates les plus servies par rapport à leur quota. Aucune part ne dépasse l'effectif de sa strate.
+
+    Retour:
+        dict
+    """
+    effectif_total = sum(effectifs.values())
+    total = min(nombre, effectif_total)
+    quotas = {modalite: total * effectif / effectif_total for modalite, effectif in effectifs.items()}
+    minimum = 1 if total >= len(effectifs) else 0
+    parts = {modalite: max(minimum, int(quota)) for modalite, quota in quotas.items()}
+    ecart = total - sum(parts.values())
+    # Plus forts restes: ecart est inférieur au nombre de strates dont le quota n'est pas entier
+    for modalite in sorted(parts, key=lambda m: quotas[m] - parts[m], reverse=True)[:max(ecart, 0)]:
+        parts[modalite] += 1
+    while ecart < 0:
+        modalite = min((m for m in parts if parts[m] > 1), key=lambda m: quotas[m] - parts[m])
+        parts[modalite] -= 1
+        ecart += 1
+    return parts
 
 
 def check_reference_files():
@@ -77,11 +334,16 @@ def check_reference_files():
     Vérifie la présence des fichiers datas nécessaires, dans le dossier data.
         StockEtablissement_utf8.csv, cpv_2008_ver_2013.xlsx, geoflar-communes-2015.csv,
         departement2020.csv, region2020.csv, StockUniteLegale_utf8.csv
+    StockEtablissement_utf8.csv n'est pas nécessaire si la base SIRENE des établissements existe au format attendu.
     """
     path_data = conf_data["path_to_data"]
     l_key_useless = ["path_to_project", "path_to_data"]
     path = os.path.join(os.getcwd(), path_data)
     for key in list(conf_data.keys()):
+        if key == "base_sirene_insee" and sirene.base_utilisable():
+            # Le stock n'est pas nécessaire si la base SIRENE est déjà construite (cf sirene.py)
+            logger.info(f'Base SIRENE {sirene.chemin_base} présente, le fichier {conf_data[key]} est facultatif')
+            continue
         if key not in l_key_useless:
             logger.info(f'Test du fichier {conf_data[key]}')
             mask = os.path.exists(os.path.join(path, conf_data[key]))
@@ -115,33 +377,63 @@ def manage_titulaires(df: pd.DataFrame):
 
     # Création d'une colonne nbTitulairesSurCeMarche.
     # Cette colonne sera retravaillé dans la fonction detection_accord_cadre
-    df.loc[:, "nbTitulairesSurCeMarche"] = df['titulaires'].apply(lambda x: len(x))
+    longueurs = df['titulaires'].map(len).to_numpy()
+    df.loc[:, "nbTitulairesSurCeMarche"] = longueurs
 
-    df_titulaires = pd.concat([pd.DataFrame.from_records(x) for x in df['titulaires']],
-                              keys=df.index).reset_index(level=1, drop=True)
+    # Une ligne par titulaire: les listes sont aplaties en une seule fois et chaque marché est répété autant de fois
+    # qu'il a de titulaires. Les marchés avec une liste vide sont conservés avec une ligne sans titulaire.
+    titulaires = list(chain.from_iterable(liste if len(liste) else [{}] for liste in df['titulaires']))
+    df_titulaires = pd.DataFrame.from_records(titulaires)
     df_titulaires.rename(columns={"id": "idTitulaires"}, inplace=True)
-    df = df.drop('titulaires', axis=1).join(df_titulaires).reset_index(drop=True)
+    positions = np.repeat(np.arange(len(df)), np.maximum(longueurs, 1))
+    df = df.drop('titulaires', axis=1).iloc[positions].reset_index(drop=True).join(df_titulaires)
 
     return df
 
 
+# Colonnes qui identifient une ligne (un titulaire d'un marché) pour la suppression des doublons
+colonnes_doublons = ['source', '_type', 'nature', 'procedure', 'dureeMois', 'datePublicationDonnees',
+                     'lieuExecution.code', 'lieuExecution.typeCode', 'lieuExecution.nom', 'id', 'objet', 'codeCPV',
+                     'dateNotification', 'montant', 'formePrix', 'acheteur.id', 'acheteur.nom', 'typeIdentifiant',
+                     'idTitulaires', 'denominationSociale']
+
+
+def calcul_empreinte_ligne(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Calcul d'une empreinte 64 bits (colonne empreinteLigne) des colonnes_doublons de chaque ligne. Deux lignes de
+    même empreinte sont des doublons. Les colonnes numériques sont converties en float64 pour que l'empreinte ne
+    dépende pas du type retenu à la lecture (int64 ou Int64 selon la présence de valeurs manquantes), et reste
+    comparable d'une exécution à l'autre.
+
+    Retour:
+        pd.DataFrame
+    """
+    colonnes = df[colonnes_doublons].astype({"dureeMois": "float64", "montant": "float64"})
+    df["empreinteLigne"] = pd.util.hash_pandas_object(colonnes, index=False, categorize=True).to_numpy()
+    return df
+
+
 def manage_duplicates(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Permet la suppression des eventuels doublons pour un subset précis du dataframe
+    Permet la suppression des eventuels doublons pour un subset précis du dataframe (colonnes_doublons), à partir
+    de l'empreinte des lignes (cf calcul_empreinte_ligne).
+    En exécution incrémentale, les lignes déjà retenues lors de la dernière exécution validée sont aussi supprimées
+    (cf incremental.filtre_lignes_connues).
 
     Retour:
         pd.DataFrame
     """
     logger.info("Début du traitement: Suppression des doublons")
     nb_ligne_avant_suppression = len(df)
-    df.drop_duplicates(subset=['source', '_type', 'nature', 'procedure', 'dureeMois',
-                               'datePublicationDonnees', 'lieuExecution.code', 'lieuExecution.typeCode',
-                               'lieuExecution.nom', 'id', 'objet', 'codeCPV', 'dateNotification', 'montant',
-                               'formePrix', 'acheteur.id', 'acheteur.nom', 'typeIdentifiant', 'idTitulaires',
-                               'denominationSociale'],
-                       keep='first',
-                       inplace=True)
+    if incremental.est_actif():
+        mask_connues = incremental.filtre_lignes_connues(df["empreinteLigne"])
+        logger.info(f"Nombre de lignes doublons d'une exécution précédente supprimées: {sum(mask_connues)}")
+        df = df[~mask_connues]
+    df = df[~df["empreinteLigne"].duplicated(keep='first')]
     df.reset_index(inplace=True, drop=True)
+    if incremental.est_actif():
+        incremental.enregistrement_empreintes_lignes(df[["empreinteLigne", "empreinteMarche"]])
+    df = df.drop(columns="empreinteLigne")
     nb_ligne_apres_suppresion = len(df)
 
     # Ecriture dans les logs
@@ -176,71 +468,107 @@ def is_false_amount(x: float, threshold: int = 5) -> bool:
     return False
 
 
+def is_false_amount_vectorise(montants: np.ndarray, threshold: int = 5) -> np.ndarray:
+    """
+    Version vectorisée de is_false_amount, avec la même règle: la partie entière du montant contient plus de threshold
+    fois le même chiffre (hors 0).
+    Chaque montant distinct n'est évalué qu'une fois: les chiffres en base 10 des valeurs uniques sont extraits par
+    divisions successives sur un tableau d'entiers, et comptés dans un histogramme (une ligne par valeur, une colonne
+    par chiffre). Les zéros de tête ajoutés par l'extraction ne sont pas comptés puisque le chiffre 0 est ignoré.
+    Les montants supérieurs à 1e18, hors de portée des entiers 64 bits, sont évalués avec is_false_amount.
+
+    Retour:
+        np.ndarray de bool
+    """
+    montants = np.asarray(montants, dtype=np.float64)
+    valeurs, inverse = np.unique(montants, return_inverse=True)
+    resultat_valeurs = np.zeros(len(valeurs), dtype=bool)
+    parties_entieres = np.abs(np.trunc(valeurs))
+    mask_entier = np.isfinite(parties_entieres) & (parties_entieres < 1e18)
+
+    entiers = parties_entieres[mask_entier].astype(np.int64)
+    histogramme = np.zeros((len(entiers), 10), dtype=np.int8)
+    lignes = np.arange(len(entiers))
+    # 1e18 a 19 chiffres
+    for _ in range(19):
+        histogramme[lignes, entiers % 10] += 1
+        entiers //= 10
+    resultat_valeurs[mask_entier] = (histogramme[:, 1:] > threshold).any(axis=1)
+
+    mask_grand = np.isfinite(parties_entieres) & ~mask_entier
+    resultat_valeurs[mask_grand] = [is_false_amount(x, threshold) for x in valeurs[mask_grand]]
+    return resultat_valeurs[inverse.reshape(-1)]
+
+
+# Règles de correction, par ordre de priorité: (code motif, condition, valeur corrigée).
+# Conditions et valeurs sont des fonctions du contexte (dict de np.ndarray), cf application_regles.
+# Les montants aberrants sont remis à 0. Le montant de référence est le montant par titulaire.
+REGLES_MONTANT = [
+    ("montant_manquant", lambda c: np.isnan(c["montant"]), 0),
+    ("chiffre_repete", lambda c: is_false_amount_vectorise(np.nan_to_num(c["montant"])), 0),
+    ("inferieur_borne_inf", lambda c: c["montantParTitulaire"] <= 200.0, 0),
+    ("superieur_borne_sup", lambda c: c["montantParTitulaire"] >= 9.99e8, 0),
+]
+# Les durées jugées exprimées en jours et non en mois sont divisées par 30
+REGLES_DUREE = [
+    ("duree_egale_montant", lambda c: c["montant"] == c["duree"], lambda c: c["dureeEnMois"]),
+    ("ratio_montant_duree_100", lambda c: c["montant"] / c["duree"] < 100, lambda c: c["dureeEnMois"]),
+    ("ratio_montant_duree_1000", lambda c: (c["montant"] / c["duree"] < 1000) & (c["duree"] >= 12),
+     lambda c: c["dureeEnMois"]),
+    ("duree_30_31_jours", lambda c: np.isin(c["duree"], [30, 31]) & (c["montant"] < 200000),
+     lambda c: c["dureeEnMois"]),
+    ("duree_360_366_jours", lambda c: np.isin(c["duree"], [360, 365, 366]) & (c["montant"] < 10000000),
+     lambda c: c["dureeEnMois"]),
+    ("duree_superieure_120", lambda c: (c["duree"] > 120) & (c["montant"] < 2000000), lambda c: c["dureeEnMois"]),
+]
+
+
+def application_regles(contexte: dict, regles: list, defaut: np.ndarray, nom: str) -> tuple:
+    """
+    Applique en une passe une liste de règles de correction (cf REGLES_MONTANT, REGLES_DUREE) : pour chaque ligne, la
+    première règle dont la condition est vérifiée donne la valeur corrigée, sinon la valeur par défaut est conservée.
+    Le motif de correction est renvoyé sous forme de catégorie ("aucune" si aucune règle ne s'applique) et le nombre
+    de lignes corrigées par chaque règle est écrit dans les logs.
+
+    Retour:
+        - np.ndarray des valeurs corrigées
+        - pd.Categorical des motifs de correction
+    """
+    codes = [code for code, _, _ in regles]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        conditions = [np.asarray(condition(contexte), dtype=bool) for _, condition, _ in regles]
+        valeurs = [valeur(contexte) if callable(valeur) else valeur for _, _, valeur in regles]
+    valeur_corrigee = np.select(conditions, valeurs, default=defaut)
+    motif = np.select(conditions, np.arange(1, len(regles) + 1), default=0)
+    nb_par_regle = np.bincount(motif, minlength=len(regles) + 1)
+    for code, nb in zip(codes, nb_par_regle[1:]):
+        logger.info(f"{nb} {nom}(s) corrigé(s) par la règle {code}")
+    logger.info(f"Au total, {len(motif) - nb_par_regle[0]} {nom}(s) ont été corrigé(s)")
+    return valeur_corrigee, pd.Categorical.from_codes(motif, categories=["aucune"] + codes)
+
+
 def manage_amount(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Travail sur la détection des montants erronés. Ici inférieur à 200, supérieur à 9.99e8 et
+    Travail sur la détection des montants erronés (cf REGLES_MONTANT). Ici inférieur à 200, supérieur à 9.99e8 et
     si la partie entière du montant est composé d'au moins 5 fois le même chiffre hors 0.
     Exemple de montant érronés:
         - 999 999
         - 222 522
+    Le montant est réparti entre les titulaires du marché. La règle appliquée est conservée dans motifCorrectionMontant.
 
     Retour:
         pd.DataFrame
     """
 
     logger.info("Début du traitement: Détection et correction des montants aberrants")
-    # Identifier les outliers - travail sur les montants
     df["montant"] = pd.to_numeric(df["montant"])
-    df['montantCalcule'] = df["montant"]
-    df['montantCalcule'].fillna(0, inplace=True)
-    # variable témoin pour les logs
-    try :
-        nb_montant_calcul_egal_zero = df.montantCalcule.value_counts()[0]
-    except:
-        nb_montant_calcul_egal_zero = 0
-    # Détection des montants "1 chiffre"
-    df["montantCalcule"] = df["montantCalcule"].apply(lambda x: 0 if is_false_amount(x) else abs(x))
-    try :
-        nb_montant_calcul_egal_zero_2 = df.montantCalcule.value_counts()[0]
-    except:
-        nb_montant_calcul_egal_zero_2 = 0
-    logger.info(f"{nb_montant_calcul_egal_zero_2 - nb_montant_calcul_egal_zero} montant(s) correspondaient à des"
-                f"suites d'un seul chiffre. Exemple: 9 999 999")
-    try :
-        nb_montant_calcul_egal_zero = df.montantCalcule.value_counts()[0]
-    except:
-        nb_montant_calcul_egal_zero = 0
-    # Définition des bornes inf et sup et traitement
-    borne_inf = 200.0
-    borne_sup = 9.99e8
-    df["montantCalcule"] = df["montantCalcule"] / df["nbTitulairesSurCeMarche"]
-    df['montantCalcule'] = np.where(df['montantCalcule'] <= borne_inf, 0, df['montantCalcule'])
-    try :
-        nb_montant_calcul_egal_zero_2 = df.montantCalcule.value_counts()[0]
-    except:
-        nb_montant_calcul_egal_zero_2 = 0
-    logger.info(f"{nb_montant_calcul_egal_zero_2 - nb_montant_calcul_egal_zero}"
-                f" montant(s) étaient inférieurs à la borne inf {borne_inf}")
-    try :
-        nb_montant_calcul_egal_zero = df.montantCalcule.value_counts()[0]
-    except:
-        nb_montant_calcul_egal_zero = 0
-    df['montantCalcule'] = np.where(df['montantCalcule'] >= borne_sup, 0, df['montantCalcule'])
-    try :
-        nb_montant_calcul_egal_zero_2 = df.montantCalcule.value_counts()[0]
-    except:
-        nb_montant_calcul_egal_zero_2 = 0
-    logger.info(f"{nb_montant_calcul_egal_zero_2 - nb_montant_calcul_egal_zero} montant(s) étaient supérieurs à "
-                f"la borne sup: {borne_sup}")
+    montant = df["montant"].to_numpy(dtype=np.float64)
+    contexte = {"montant": montant,
+                "montantParTitulaire": np.abs(montant) / df["nbTitulairesSurCeMarche"].to_numpy(dtype=np.float64)}
+    df['montantCalcule'], df['motifCorrectionMontant'] = application_regles(
+        contexte, REGLES_MONTANT, contexte["montantParTitulaire"], "montant")
     # Colonne supplémentaire pour indiquer si la valeur est estimée ou non
     df['montantEstime'] = np.where(df['montantCalcule'] != df.montant, True, False)
-    # Ecriture dans la log
-    try :
-        nb_montant_calcul_egal_zero_2 = df.montantCalcule.value_counts()[0]
-    except:
-        nb_montant_calcul_egal_zero_2 = 0
-    logger.info(f"Au total, {nb_montant_calcul_egal_zero_2} montant(s) "
-                f"ont été corrigé (on compte aussi les montants vides).")
     logger.info("Fin du traitement")
     return df
 
@@ -271,7 +599,13 @@ def manage_missing_code(df: pd.DataFrame) -> pd.DataFrame:
     mask = (df.typeIdentifiant == 'SIRET') | \
            (df.typeIdentifiant.isnull()) | \
            (df.typeIdentifiant == 'nan')
-    df.idTitulaires[mask].replace(caracteres_speciaux_dict, inplace=True)
+    # Remplacement sur les valeurs distinctes, puis affectation par .loc (une affectation chaînée ne modifie pas le df)
+    idTitulaires = df.loc[mask, "idTitulaires"]
+    codes, valeurs = pd.factorize(idTitulaires)
+    valeurs = pd.Series(valeurs, dtype=object).astype(str)
+    for caractere, remplacement in caracteres_speciaux_dict.items():
+        valeurs = valeurs.str.replace(caractere, remplacement, regex=False)
+    df.loc[mask, "idTitulaires"] = np.where(codes == -1, idTitulaires, valeurs.to_numpy()[codes])
     df.idTitulaires = np.where(df.idTitulaires == '', np.NaN, df.idTitulaires)
     # Ecriture dans les logs
     logger.info(f"Nombre d'identifiant titualire ou un traitement sur les caractères spéciaux a été fait: {sum(mask)}")
@@ -302,79 +636,173 @@ def manage_missing_code(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def manage_region(df: pd.DataFrame) -> pd.DataFrame:
+def conversion_siret(identifiants: pd.Series) -> tuple:
+    """
+    Conversion d'identifiants textes en clefs entières: siret sur 14 chiffres (uint64) et siren correspondant, ses 9
+    premiers chiffres (uint32). Un identifiant de 9 chiffres est un siren seul. Les identifiants invalides ont la clef
+    0. La conversion est faite sur les valeurs distinctes.
+
+    Retour:
+        tuple:
+            - np.ndarray de uint64: siret
+            - np.ndarray de uint32: siren
+    """
+    codes, valeurs = pd.factorize(identifiants)
+    valeurs = pd.Series(valeurs, dtype=object).astype(str).str.strip()
+    est_siret = valeurs.str.fullmatch(r"\d{14}").to_numpy(dtype=bool)
+    est_siren = valeurs.str.fullmatch(r"\d{9}").to_numpy(dtype=bool)
+    siret = np.zeros(len(valeurs) + 1, dtype=np.uint64)
+    siret[:-1][est_siret] = valeurs[est_siret].astype(np.uint64)
+    siren = (siret // 100000).astype(np.uint32)
+    siren[:-1][est_siren] = valeurs[est_siren].astype(np.uint32)
+    # Le code -1 (valeur manquante) pointe sur la dernière case: clef 0
+    return siret[codes], siren[codes]
+
+
+def canonicalisation_identifiants(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Ajout des libellés Régions/Département pour le lieu d'execution du marché
+    Validation et conversion, une seule fois, des identifiants des titulaires et des acheteurs en clefs entières
+    utilisées pour les jointures avec la base SIRENE (cf conversion_siret):
+        - cleSiretTitulaire (uint64), cleSirenTitulaire (uint32)
+        - cleSiretAcheteur (uint64), cleSirenAcheteur (uint32)
+        - idTitulaireNonSiret: identifiant du titulaire qui n'est pas un siret valide (TVA, siren seul, ...)
+    La clef 0 indique un identifiant absent ou invalide. Un identifiant de 14 chiffres est un siret quel que soit le
+    typeIdentifiant déclaré.
 
     Retour:
         pd.DataFrame
     """
+    logger.info("Début du traitement: Canonicalisation des identifiants siret/siren")
+    df["cleSiretTitulaire"], df["cleSirenTitulaire"] = conversion_siret(df.idTitulaires)
+    df["cleSiretAcheteur"], df["cleSirenAcheteur"] = conversion_siret(df["acheteur.id"])
+    renseigne = df.idTitulaires.notnull() & ~df.idTitulaires.isin(["", "nan"])
+    df["idTitulaireNonSiret"] = df.idTitulaires.where(renseigne & (df.cleSiretTitulaire == 0))
+    logger.info(f"Siret valides: {(df.cleSiretTitulaire > 0).mean():.1%} des titulaires, "
+                f"{(df.cleSiretAcheteur > 0).mean():.1%} des acheteurs")
+    return df
 
-    logger.info("Début du traitement: Attribution et correction des régions/déprtements (code + libelle). "
-                "Zone d'execution du marché")
-    # Régions / Départements #
-    # Création de la colonne pour distinguer les départements
-    logger.info("Création de la colonne département Execution")
-    df['codeDepartementExecution'] = df['lieuExecution.code'].str[:3]
-    liste_correspondance = conf_glob["nettoyage"]["DOM2name"]
-    df['codeDepartementExecution'].replace(liste_correspondance, inplace=True)
-
-    df['codeDepartementExecution'] = df['codeDepartementExecution'].str[:2]
-
-    liste_correspondance_2 = conf_glob["nettoyage"]["name2DOMCOM"]
-    df['codeDepartementExecution'].replace(liste_correspondance_2, inplace=True)
-
-    # Vérification si c'est bien un code département
-    liste_cp = conf_glob["nettoyage"]["code_CP"].split(',') \
-        + [str(i) for i in list(np.arange(10, 96, 1))]
-    df['codeDepartementExecution'] = np.where(~df['codeDepartementExecution'].isin(liste_cp), np.NaN,
-                                              df['codeDepartementExecution'])
-
-    # Suppression des codes régions (qui sont retenues jusque là comme des codes postaux)
-    df['lieuExecution.typeCode'] = np.where(df['lieuExecution.typeCode'].isna(), np.NaN, df['lieuExecution.typeCode'])
-    df['codeDepartementExecution'] = np.where(df['lieuExecution.typeCode'] == 'Code région', np.NaN,
-                                              df['codeDepartementExecution'])
-
-    # Récupération des codes régions via le département
-    logger.info("Ajout des code regions pour le lieu d'execution")
+
+@lru_cache(maxsize=None)
+def referentiel_departements() -> dict:
+    """
+    Lecture (une seule fois par processus) de la base departement de l'Insee: {code département: (code région,
+    libellé du département)}
+
+    Retour:
+        dict
+    """
     path_dep = os.path.join(path_to_data, conf_data["departements-francais"])
     departement = pd.read_csv(path_dep, sep=",", usecols=['dep', 'reg', 'libelle'], dtype={"dep": str, "reg": str,
                                                                                            "libelle": str})
-    df['codeDepartementExecution'] = df['codeDepartementExecution'].astype(str)
-    df = pd.merge(df, departement, how="left",
-                  left_on="codeDepartementExecution", right_on="dep")
-    df.rename(columns={"reg": "codeRegionExecution"}, inplace=True)
-    # On supprime la colonne dep, doublon avec codeDepartementExecution
-    del df["dep"]
-    # Ajout des codes régions qui existaient déjà dans la colonne lieuExecution.code
-    df['codeRegionExecution'] = np.where(df['lieuExecution.typeCode'] == "Code région", df['lieuExecution.code'],
-                                         df['codeRegionExecution'])
-    df['codeRegionExecution'] = df['codeRegionExecution'].astype(str)
-    # Vérification des codes région
-    liste_reg = conf_glob["nettoyage"]["code_reg"].split(',')  # 98 = collectivité d'outre mer
-
-    df['codeRegionExecution'] = np.where(~df['codeRegionExecution'].isin(liste_reg), np.NaN, df['codeRegionExecution'])
-    # Identification du nom des régions
-    df['codeRegionExecution'] = df['codeRegionExecution'].astype(str)
-
-    # Import de la base region de l'Insee
-    logger.info("Ajout du libelle des regions d'execution")
+    departement = departement.drop_duplicates(subset="dep").set_index("dep")
+    return dict(zip(departement.index, zip(departement.reg, departement.libelle)))
+
+
+@lru_cache(maxsize=None)
+def referentiel_regions() -> dict:
+    """
+    Lecture (une seule fois par processus) de la base region de l'Insee: {code région: libellé de la région}
+
+    Retour:
+        dict
+    """
     path_reg = os.path.join(path_to_data, conf_data["region-fr"])
     region = pd.read_csv(path_reg, sep=",", usecols=["reg", "libelle"], dtype={"reg": str, "libelle": str})
-    region.columns = ["reg", "libelle_reg"]
+    return dict(zip(region.reg, region.libelle))
+
+
+@lru_cache(maxsize=None)
+def codes_valides(clef: str) -> frozenset:
+    """
+    Liste des codes départements (clef code_CP) ou régions (clef code_reg) de var_glob.json, sans les espaces qui
+    suivent les virgules. Les départements de 10 à 95 sont ajoutés à la liste des codes départements.
+
+    Retour:
+        frozenset
+    """
+    codes = [code.strip() for code in conf_glob["nettoyage"][clef].split(',')]
+    if clef == "code_CP":
+        codes += [str(i) for i in range(10, 96)]
+    return frozenset(codes)
+
+
+def resolution_lieu_execution(code, type_code) -> tuple:
+    """
+    Code département, code région et libellés correspondants d'un lieu d'exécution (lieuExecution.code et
+    lieuExecution.typeCode). Le département est déduit des premiers caractères du code (les DOM sont identifiés par
+    leurs 3 premiers chiffres), sauf pour les codes région.
+
+    Retour:
+        tuple (codeDepartementExecution, codeRegionExecution, libellé département, libelleRegionExecution)
+    """
+    departement = np.NaN
+    region = np.NaN
+    if isinstance(type_code, str) and type_code == 'Code région':
+        region = code
+    elif isinstance(code, str):
+        departement = code[:3]
+        departement = conf_glob["nettoyage"]["DOM2name"].get(departement, departement)[:2]
+        departement = conf_glob["nettoyage"]["name2DOMCOM"].get(departement, departement)
+        if departement not in codes_valides("code_CP"):
+            departement = np.NaN
+        region = referentiel_departements().get(departement, (np.NaN, np.NaN))[0]
+    libelle_departement = referentiel_departements().get(departement, (np.NaN, np.NaN))[1]
+    if region not in codes_valides("code_reg"):
+        region = np.NaN
+    libelle_region = referentiel_regions().get(region, np.NaN)
+    return str(departement), str(region), libelle_departement, libelle_region
+
 
-    df = pd.merge(df, region, how="left",
-                  left_on="codeRegionExecution", right_on="reg")
-    df.rename(columns={"libelle_reg": "libelleRegionExecution"}, inplace=True)
-    # On supprime la colonne reg, doublon avec codeRegionExecution
-    del df["reg"]
+def manage_region(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Ajout des libellés Régions/Département pour le lieu d'execution du marché.
+    Chaque couple (lieuExecution.code, lieuExecution.typeCode) distinct n'est résolu qu'une fois
+    (cf resolution_lieu_execution), le résultat est ensuite réparti sur les lignes.
+
+    Retour:
+        pd.DataFrame
+    """
+
+    logger.info("Début du traitement: Attribution et correction des régions/déprtements (code + libelle). "
+                "Zone d'execution du marché")
+    # Identification des couples (code, typeCode) distincts
+    codes_code, _ = pd.factorize(df['lieuExecution.code'])
+    codes_type, uniques_type = pd.factorize(df['lieuExecution.typeCode'])
+    cle = (codes_code.astype(np.int64) + 1) * (len(uniques_type) + 1) + codes_type + 1
+    _, premieres, inverse = np.unique(cle, return_index=True, return_inverse=True)
+    couples = df[['lieuExecution.code', 'lieuExecution.typeCode']].iloc[premieres]
+    logger.info(f"{len(couples)} lieux d'exécution distincts")
+
+    resolutions = [resolution_lieu_execution(code, type_code) for code, type_code in couples.itertuples(index=False)]
+    colonnes = ['codeDepartementExecution', 'codeRegionExecution', 'libelle', 'libelleRegionExecution']
+    for col, valeurs in zip(colonnes, zip(*resolutions)):
+        df[col] = np.array(valeurs, dtype=object)[inverse.reshape(-1)]
     logger.info("Fin du traitement")
     return df
 
 
+def conversion_date(serie: pd.Series) -> pd.Series:
+    """
+    Conversion en datetime64 d'une colonne de dates au format AAAA-MM-JJ. Seuls les 10 premiers caractères sont
+    utilisés (les heures et fuseaux horaires sont ignorés). Les dates invalides, incomplètes (ex: "2019" ou "2019-03",
+    que to_datetime compléterait au premier janvier ou au premier du mois) ou hors des limites du type datetime64
+    sont remplacées par NaT et comptées dans les logs.
+
+    Retour:
+        pd.Series
+    """
+    texte = serie.astype("string").str.slice(0, 10)
+    conforme = texte.str.match(r"^\d{4}-\d{2}-\d{2}$").fillna(False).astype(bool)
+    dates = pd.to_datetime(texte.where(conforme), format="%Y-%m-%d", errors="coerce")
+    nb_invalides = (texte.notna() & (texte != '') & dates.isna()).sum()
+    logger.info(f"{nb_invalides} valeur(s) de la colonne {serie.name} ne sont pas des dates valides")
+    return dates
+
+
 def manage_date(df: pd.DataFrame) -> pd.DataFrame:
     """
-        Récupération de l'année de notification du marché ainsi que son mois à partir de la variable dateNotification.
+        Conversion des dates de notification et de publication des données en datetime64, récupération de l'année de
+        notification du marché ainsi que son mois à partir de la variable dateNotification.
 
     Retour:
         - pd.DataFrame
@@ -384,24 +812,19 @@ def manage_date(df: pd.DataFrame) -> pd.DataFrame:
                 "Correction des années aberrantes")
     # Date / Temps #
     # ..............Travail sur les variables de type date
-    df.datePublicationDonnees = df.datePublicationDonnees.str[0:10]
-    df.dateNotification = df.dateNotification.str[0:10]
-    # On récupère l'année de notification
-    logger.info("Récupération de l'année")
-    df['anneeNotification'] = df.dateNotification.str[0:4]
-    df['anneeNotification'] = df['anneeNotification'].astype(float)
+    df['datePublicationDonnees'] = conversion_date(df['datePublicationDonnees'])
+    date_notification = conversion_date(df['dateNotification'])
     # On supprime les erreurs (0021 ou 2100 par exemple)
-    df['dateNotification'] = np.where(df['anneeNotification'] < 1980, np.NaN, df['dateNotification'])
-    df['dateNotification'] = np.where(df['anneeNotification'] > 2100, np.NaN, df['dateNotification'])
-    df['anneeNotification'] = np.where(df['anneeNotification'] < 1980, np.NaN, df['anneeNotification'])
-    df['anneeNotification'] = np.where(df['anneeNotification'] > 2100, np.NaN, df['anneeNotification'])
-    logger.info("Au total, {} marchés avaient une année érronée".format(sum(df["anneeNotification"].isna())))
-    df['anneeNotification'] = df.anneeNotification.astype(str).str[:4]
-
-    # On récupère le mois de notification
-    logger.info("Récupération du mois")
-    df['moisNotification'] = df.dateNotification.str[5:7]
-    df.datePublicationDonnees = np.where(df.datePublicationDonnees == '', np.NaN, df.datePublicationDonnees)
+    annee = date_notification.dt.year
+    date_notification = date_notification.mask((annee < 1980) | (annee > 2100))
+    df['dateNotification'] = date_notification
+    logger.info("Au total, {} marchés avaient une année érronée".format(sum(date_notification.isna())))
+
+    # On récupère l'année et le mois de notification, sous forme de textes ("nan" si l'année est inconnue)
+    logger.info("Récupération de l'année et du mois")
+    annee = date_notification.dt.year
+    df['anneeNotification'] = annee.map({a: str(int(a)) for a in annee.dropna().unique()}).fillna("nan")
+    df['moisNotification'] = date_notification.dt.month.map({m: f"{m:02d}" for m in range(1, 13)})
     logger.info(f"Au total, {sum(df['datePublicationDonnees'].isna())} marchés n'ont pas de date de publication des"
                 "données connue")
     logger.info("Fin du traitement")
@@ -411,33 +834,22 @@ def manage_date(df: pd.DataFrame) -> pd.DataFrame:
 
 def correct_date(df: pd.DataFrame) -> pd.DataFrame:
     """
-    Travail sur les durées des contrats. Recherche des durées exprimées en Jour et non pas en mois
+    Travail sur les durées des contrats. Recherche des durées exprimées en Jour et non pas en mois (cf REGLES_DUREE).
+    La règle appliquée est conservée dans motifCorrectionDuree.
 
     Retour:
         - pd.DataFrame
     """
     logger.info("Début du traitement: Correction de la variable dureeMois.")
-    # On cherche les éventuelles erreurs mois -> jours
     df['montantCalcule'] = df['montantCalcule'].astype(np.int64)
-    df['dureeMois'] = df['dureeMois'].astype(np.int64)
-    mask = ((df['montantCalcule'] == df['dureeMois'])
-            | (df['montantCalcule'] / df['dureeMois'] < 100)
-            | (df['montantCalcule'] / df['dureeMois'] < 1000) & (df['dureeMois'] >= 12)
-            | ((df['dureeMois'] == 30) & (df['montantCalcule'] < 200000))
-            | ((df['dureeMois'] == 31) & (df['montantCalcule'] < 200000))
-            | ((df['dureeMois'] == 360) & (df['montantCalcule'] < 10000000))
-            | ((df['dureeMois'] == 365) & (df['montantCalcule'] < 10000000))
-            | ((df['dureeMois'] == 366) & (df['montantCalcule'] < 10000000))
-            | ((df['dureeMois'] > 120) & (df['montantCalcule'] < 2000000)))
-
-    df['dureeMoisEstimee'] = np.where(mask, "True", "False")
-
-    # On corrige pour les colonnes considérées comme aberrantes, on divise par 30 (nombre de jours par mois)
-    df['dureeMoisCalculee'] = np.where(mask, round(df['dureeMois'] / 30, 0), df['dureeMois'])
+    # Les durées manquantes sont conservées dans dureeMois et corrigées à 0 dans dureeMoisCalculee
+    duree = df['dureeMois'].fillna(0).to_numpy(dtype=np.int64)
+    contexte = {"montant": df['montantCalcule'].to_numpy(), "duree": duree, "dureeEnMois": np.round(duree / 30, 0)}
+    duree_calculee, df['motifCorrectionDuree'] = application_regles(contexte, REGLES_DUREE, duree, "duree")
+    df['dureeMoisEstimee'] = df['motifCorrectionDuree'] != "aucune"
     # Comme certaines valeurs atteignent zero, on remplace par un mois
     # Il y a une valeur négative
-    df['dureeMoisCalculee'] = np.where(df['dureeMoisCalculee'] <= 0, 1, df['dureeMoisCalculee'])
-    logger.info(f"Au total, {sum(mask)} duree de marché en mois ont été jugées rentrées en jour et non en mois.")
+    df['dureeMoisCalculee'] = np.where(duree_calculee <= 0, 1, duree_calculee)
     logger.info("Fin du traitement")
 
     return df
@@ -447,47 +859,94 @@ def data_inputation(df: pd.DataFrame) -> pd.DataFrame:
     """
     Permet une estimation de la dureeMois grace au contenu de la commande (codeCPV).
     Dans le cas des Fournitures et des Services (toutes les commandes hors Travaux),
-    si la durée est supérieur à 10 ans, alors on impute par la médiane des durées pour le même codeCPV
+    si la durée est supérieur à 10 ans, alors on impute par la médiane des durées pour un codeCPV proche.
+    Les niveaux de proximité sont les préfixes du codeCPV de longueurs niveaux_cpv (var_glob.json, clef
+    imputation_duree): par défaut le code complet (8 chiffres), le groupe (3 chiffres) puis la division (CPV_min).
+    On retient le premier niveau dont le groupe compte au moins effectif_minimum durées, sauf pour le dernier niveau
+    qui est toujours utilisé. Les médianes sont calculées sur les durées qui ne sont pas à imputer.
 
     Retour
         - pd.DataFrame
     """
     logger.info("Début du tritement: Imputation de la variable dureeMois")
-    df_intermediaire = df[["objet", "dureeMois", "dureeMoisEstimee", "dureeMoisCalculee", "CPV_min", "montantCalcule"]]
-    # On fait un groupby sur la division des cpv (CPV_min) afin d'obtenir toutes les durees par division
-    df_group = pd.DataFrame(df_intermediaire.groupby(["CPV_min"])["dureeMoisCalculee"])
-    # On cherche à obtenir la médiane par division de CPV
-    df_group.columns = ["CPV_min", "listeDureeMois"]
-    df_group["mediane_dureeMois_CPV"] = df_group.listeDureeMois.apply(np.median)
-    # La liste des duree exacte est inutile: on supprime
-    df_group.drop("listeDureeMois", axis=1, inplace=True)
-    # On ajoute provisoirement la colonne mediane_dureeMois
-    df = pd.merge(df, df_group, how="left", left_on="CPV_min", right_on="CPV_min", copy=False)
+    conf_imputation = conf_glob["nettoyage"]["imputation_duree"]
     # 120 = 10 ans. duree arbitraire jugée trop longue.
     # En l'etat, on ne touche pas au duree concernant la catégorie Travaux. identifié par le codeCPV_min == 45.
-    mask = ((df.dureeMoisCalculee > 120) & (df.CPV_min != '45'))
+    mask = ((df.dureeMoisCalculee > 120) & (df.CPV_min != '45')).to_numpy()
     logger.info(f"Au total, {sum(mask)} duree en mois sont encore supérieures à 120 "
                 f"(et les marchés ne concernent pas le monde des travaux)")
-    df.dureeMoisCalculee = np.where(mask, df.mediane_dureeMois_CPV, df.dureeMoisCalculee)
+    duree_reference = df.dureeMoisCalculee.where(~mask)
+    imputation = pd.Series(np.NaN, index=df.index)
+    niveaux = conf_imputation["niveaux_cpv"]
+    for niveau in niveaux:
+        groupes = duree_reference.groupby(df.codeCPV.str[:niveau])
+        mediane = groupes.transform('median')
+        if niveau != niveaux[-1]:
+            mediane = mediane.where(groupes.transform('count') >= conf_imputation["effectif_minimum"])
+        a_imputer = mask & imputation.isna().to_numpy() & mediane.notna().to_numpy()
+        imputation[a_imputer] = mediane[a_imputer]
+        logger.info(f"{sum(a_imputer)} duree(s) imputée(s) par la médiane des codes CPV de même préfixe à {niveau} "
+                    f"caractères")
+    mask = mask & imputation.notna().to_numpy()
+    df['dureeMoisCalculee'] = np.where(mask, imputation, df.dureeMoisCalculee)
     # On modifie au passage la colonne dureeMoisEstimee
-    df['dureeMoisEstimee'] = np.where(mask, "True", df.dureeMoisEstimee)
-    # La mediane n'est pas utile dans le df final: on supprime
-    df.drop("mediane_dureeMois_CPV", axis=1, inplace=True)
+    df['dureeMoisEstimee'] = mask | df.dureeMoisEstimee
 
     logger.info("Fin du traitement")
     return df
 
 
-def replace_char(df: pd.DataFrame) -> pd.DataFrame:
+def normalisation_valeur_texte(valeur: str, table: dict, casse: str = None) -> str:
     """
-    Fonction pour mettre en qualité le champ objetMarche
+    Normalisation d'un texte: réparation des textes utf-8 lus en cp1252/latin-1 (ex: "Ã©" au lieu de "é"),
+    remplacement des caractères de la table de traduction, suppression des espaces superflus et éventuellement
+    mise en majuscules/minuscules (casse "majuscule" ou "minuscule").
+
+    Retour:
+        str
+    """
+    if "Ã" in valeur or "Â" in valeur:
+        for encodage in ("cp1252", "latin-1"):
+            try:
+                valeur = valeur.encode(encodage).decode("utf-8")
+                break
+            except UnicodeError:
+                pass
+    valeur = " ".join(valeur.translate(table).split())
+    if casse == "majuscule":
+        valeur = valeur.upper()
+    elif casse == "minuscule":
+        valeur = valeur.lower()
+    return valeur
+
+
+def normalisation_texte(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Mise en qualité des champs textes (objet, noms des acheteurs et des titulaires, cf clef normalisation_texte de
+    var_glob.json). Les caractères mal convertis (�) sont remplacés par XXXXX.
+    Chaque colonne est factorisée: seules les valeurs distinctes sont normalisées (cf normalisation_valeur_texte),
+    puis la colonne est reconstruite en catégorie à partir des codes.
 
     Retour:
         - pd.DataFrame
     """
-    logger.info("Début du traitement: Remplacement des caractères mal converti")
-    # Remplacement brutal du caractère (?) par XXXXX
-    df['objet'] = df['objet'].str.replace('�', 'XXXXX')
+    logger.info("Début du traitement: Normalisation des champs textes")
+    conf_normalisation = conf_glob["nettoyage"]["normalisation_texte"]
+    table = str.maketrans(conf_normalisation["caracteres"])
+    for col in conf_normalisation["colonnes"]:
+        if col not in df.columns:
+            continue
+        codes, valeurs = pd.factorize(df[col])
+        valeurs_normalisees = [normalisation_valeur_texte(str(valeur), table, conf_normalisation["casse"])
+                               for valeur in valeurs]
+        codes_normalises, categories = pd.factorize(np.array(valeurs_normalisees, dtype=object))
+        # Le code -1 des valeurs manquantes est conservé
+        codes = np.append(codes_normalises, -1)[codes]
+        df[col] = pd.Categorical.from_codes(codes, categories=categories)
+        nb_modifiees = sum(valeur != valeur_normalisee for valeur, valeur_normalisee in zip(valeurs,
+                                                                                          valeurs_normalisees))
+        logger.info(f"Colonne {col}: {nb_modifiees} valeur(s) distincte(s) modifiée(s) sur {len(valeurs)}, "
+                    f"{len(categories)} valeur(s) distincte(s) après normalisation")
     logger.info("Fin du traitement")
     return df
 
@@ -495,60 +954,46 @@ def replace_char(df: pd.DataFrame) -> pd.DataFrame:
 def regroupement_marche_complet(df):
     """la colonne id n'est pas unique. Cette fonction permet de la rendre unique en regroupant
     les marchés en fonction de leur objets/date de publication des données et montant.
-    Ajoute dans le meme temps la colonne nombreTitulaireSurMarchePresume"""
-    # Creation du sub DF necessaire
-    df_titulaires = pd.DataFrame()
-    df_to_update = pd.DataFrame()
-    df_intermediaire = df[["objet", "datePublicationDonnees", "montant", "id"]]  # "datePublicationDonnees",
+    Ajoute dans le meme temps la colonne nombreTitulaireSurMarchePresume
+    Un groupe contenant un id manquant conserve ses id d'origine (il arrive que parfois on n'ait pas d'ID,
+    ex aife 675 , ctrl-f "Acquisition d acce")"""
+    # Les id sont remplacés par leur rang dans l'ordre alphabétique: le max des codes donne le max des id,
+    # et un code -1 (id manquant) donne un min négatif
+    codes_id, valeurs_id = pd.factorize(df["id"], sort=True)
     # On regroupe selon l objet du marché. Attention, objet pas forcément unique mais idMarche ne l'est pas non plus.
-    df_group = pd.DataFrame(df_intermediaire.groupby(["objet",
-                                                      "datePublicationDonnees", "montant"])["id"])
-    # Initialisation du resultat sous forme de liste
-    for i in range(len(df_group)):
-        # dataframe contenant les id d'un meme marche
-        # UP : il arrive que parfois on n'ait pas d'ID (ex aife 675 , ctrl-f "Acquisition d acce")
-        ids_to_modify = df_group[1].iloc[i]
-        # Contient les index des lignes d'un meme marché. Utile pour le update
-        new_index = list(ids_to_modify.index)
-        # Création du dataframe avec id en seule colonne et comme index les index dans le df initial
-        if ids_to_modify.isna().any():
-            value_number = pd.NA # Essentiel pour la construction de df_avec_bon_id. Sinon ça crash
-        else :
-            value_number = max(ids_to_modify)
-        df_avec_bon_id = pd.DataFrame(len(new_index) * [value_number], index=new_index, columns=["id"])
-        # Création d'un dataframe intermédiaire avec comme colonne nombreTitulaireSurMarchePresume
-        df_nbtitulaires = pd.DataFrame(len(new_index) * [len(new_index)], index=new_index,
-                                       columns=["nombreTitulaireSurMarchePresume"])
-        df_to_update = pd.concat([df_to_update, df_avec_bon_id])
-        # Df permettant de faire la jointure pour ajouter la colonnenombreTitulaireSurMarchePresume dans le df initial
-        df_titulaires = pd.concat([df_titulaires, df_nbtitulaires])
-        # Arbitraire, faire un update a chaque étape rallonge le temps d'execution, un update final idem.
-        if len(df_to_update) > 50000:
-            df.update(df_to_update)
-            df_to_update = pd.DataFrame()
-    # Ajout effectif de nombreTitulaireSurMarchePresume
-    df = df.merge(df_titulaires, how='left', left_index=True, right_index=True)
-    df.update(df_to_update)
+    groupes = pd.Series(codes_id, index=df.index).groupby(
+        [df["objet"], df["datePublicationDonnees"], df["montant"]], sort=False)
+    code_id_max = groupes.transform("max")
+    code_id_min = groupes.transform("min")
+    a_unifier = (code_id_min >= 0).to_numpy()  # Faux pour les lignes hors groupe (clef manquante)
+    df.loc[a_unifier, "id"] = valeurs_id.take(code_id_max[a_unifier].astype(np.int64))
+    df["nombreTitulaireSurMarchePresume"] = groupes.transform("size")
     return df
 
 
-def indice_marche_avec_modification(data: dict) -> list:
+def indice_marche_avec_modification(marches: list, decalage: int = 0) -> list:
     """
-    Renvoie la liste des indices des marchés contenant une modification
+    Renvoie la liste des indices des marchés contenant une modification.
+    decalage correspond au premier identifiant libre (nombre de marchés des lots précédents, et en exécution
+    incrémentale identifiants déjà attribués par les exécutions précédentes), afin que l'identifiant technique reste
+    unique.
 
     Retour:
         - list
     """
     liste_indices = []
-    for i in range(len(data)):
+    for i, marche in enumerate(marches):
+        # Un marché mal formé est mis en quarantaine par creation_colonnes_typees
+        if not isinstance(marche, dict):
+            continue
         # Ajout d'un identifiant technique -> Permet d'avoir une colonne id unique par marché
-        data["marches"][i]["id_technique"] = i
-        if data["marches"][i]["modifications"]:
+        marche["id_technique"] = decalage + i
+        if marche.get("modifications"):
             liste_indices += [i]
     return liste_indices
 
 
-def recuperation_colonne_a_modifier(data: dict, liste_indices: list) -> dict:
+def recuperation_colonne_a_modifier(marches: list, liste_indices: list) -> dict:
     """
     Renvoie les noms des differentes colonnes recevant une modification
     sous la forme d'un dictionnaire: {Nom_avec_modification: Nom_sans_modification}
@@ -559,8 +1004,7 @@ def recuperation_colonne_a_modifier(data: dict, liste_indices: list) -> dict:
     liste_colonne = []
     colonne_to_modify = {}
     for indice in liste_indices:
-        # colonne_modifiees = list(data["marches"][indice]["modifications"][0].keys())
-        for col in data["marches"][indice]["modifications"][0].keys():
+        for col in marches[indice]["modifications"][0].keys():
             if "Modification" not in col:
                 col += "Modification"
             if col not in liste_colonne:
@@ -576,70 +1020,43 @@ def recuperation_colonne_a_modifier(data: dict, liste_indices: list) -> dict:
 
 def prise_en_compte_modifications(df: pd.DataFrame, col_to_normalize: str = 'modifications'):
     """
-    La fonction json_normalize de pandas ne permet pas de spliter la clef modifications automatiquement.
+    La clef modifications n'est pas splitée lors de la conversion en DataFrame.
     Cette fonction permet de le faire
-    En entrée : La sortie json_normalize de pandas. (avec une colonne modifications)
+    En entrée : La sortie de creation_colonnes_typees. (avec une colonne modifications)
     Le dataframe en entrée est directement modifié dans la fonction.
     """
     # Check colonne modifications.
     if col_to_normalize not in df.columns:
         raise ValueError(f"Il n'y a aucune colonne du nom de {col_to_normalize} dans le dataframe entrée en paramètre")
-    to_normalize = df[col_to_normalize]  # Récupération de la colonne à splitter
-    df["booleanModification"] = 0
-    for i in range(len(to_normalize)):
-        json_modification = to_normalize[i]
+    # Extraction en une seule passe des modifications au format long: (ligne, champ, valeur)
+    lignes, champs, valeurs = [], [], []
+    for ligne, json_modification in enumerate(df[col_to_normalize]):
         if json_modification:  # dans le cas ou des modifications ont été apportées
-            for col in json_modification[0].keys():
-                col_init = col
+            for col, valeur in json_modification[0].items():
                 # Formatage du nom de la colonne
                 if "Modification" not in col:
                     col += "Modification"
-                if col not in df.columns:  # Cas ou on tombe sur le premier marche qui modifie un champ
-                    df[col] = ""  # Initialisation dans le df initial
-                df[col][i] = json_modification[0][col_init]
-                df["booleanModification"][i] = 1  # Création d'une booléenne pour simplifier le subset pour la suite
-
-
-def split_dataframe(df: pd.DataFrame, sub_data: pd.DataFrame, modalite: str) -> tuple:
-    """
-    Définition de deux dataFrame.
-        - Le premier qui contiendra uniquement les lignes avec modification, pour le marché ayant pour objet modalite
-        - Le second contiendra l'ensemble des lignes correspondant au marché isolé dans le df1 qui ont pour objet
-          modalite
-
-        :param df: la source totale des données
-        :param sub_data: le sous-ensemble correspondant à l'ensemble des marchés avec une modification
-        :param modalite: la modalité sur laquelle on veut filtrer
-
-        Retour:
-            tuple (pd.DataFrame, pd.DataFrame)
-    """
-    # Premier df: Contenant les lignes d'un marche avec des colonnes modifications non vide
-    marche = sub_data[sub_data.objet == modalite]
-    marche = marche.sort_values(by='id')
-    # Second dataframe: Dans le df complet, récupération des lignes correspondant au marché récupéré
-    date = marche.datePublicationDonnees.iloc[0]
-    # A concaténer ?
-    marche_init = df[df.objet == modalite]
-    marche_init = marche_init[marche_init.datePublicationDonnees == date]
-    return marche, marche_init
-
-
-def fusion_source_modification(raw: pd.DataFrame, df_source: pd.DataFrame, col_modification: list,
-                               dict_modification: dict) -> pd.DataFrame:
-    """
-    Permet de fusionner les colonnes xxxModification et sa colonne.
-    raw correspond à une ligne du df_source
-    Modifie le df_source
-
-    Retour:
-        pd.DataFrame
-    """
-    for col in col_modification:
-        col_init = dict_modification[col]
-        if raw[col] != '':
-            df_source[col_init].loc[raw.name] = raw[col]
-    return df_source
+                lignes += [ligne]
+                champs += [col]
+                valeurs += [valeur]
+    # Création d'une booléenne pour simplifier le subset pour la suite
+    boolean_modification = np.zeros(len(df), dtype=np.int64)
+    boolean_modification[lignes] = 1
+    df["booleanModification"] = boolean_modification
+    if not lignes:
+        return
+    modifications = pd.DataFrame({"ligne": lignes, "champ": champs, "valeur": pd.Series(valeurs, dtype=object)})
+    # Si deux clefs donnent le même nom de colonne, la dernière l'emporte
+    modifications = modifications.drop_duplicates(subset=["ligne", "champ"], keep="last")
+    modifications_large = modifications.pivot(index="ligne", columns="champ", values="valeur")
+    presence = modifications.assign(present=True).pivot(index="ligne", columns="champ", values="present").notna()
+    positions = modifications_large.index.to_numpy()
+    # Ecriture colonne par colonne, dans l'ordre d'apparition des champs
+    for col in pd.unique(modifications.champ):
+        colonne = df[col].to_numpy(dtype=object, copy=True) if col in df.columns else np.full(len(df), "", dtype=object)
+        masque = presence[col].to_numpy()
+        colonne[positions[masque]] = modifications_large[col].to_numpy()[masque]
+        df[col] = colonne
 
 
 def regroupement_marche(df: pd.DataFrame, dict_modification: dict) -> pd.DataFrame:
@@ -649,6 +1066,9 @@ def regroupement_marche(df: pd.DataFrame, dict_modification: dict) -> pd.DataFra
     Un marché peut être déclaré plusieurs fois en fonction du nombre d'entreprise. Si 2 entreprises sur
     En sortie: id correspondra à un identifiant unique pour toutes les lignes composants un marché SI il a eu une
     modification.
+    Un marché modifié correspond aux lignes ayant le même objet et la même datePublicationDonnees que sa première
+    modification (triée par id). Chaque ligne de modification de ce groupe reporte ses valeurs non vides dans ses
+    propres colonnes; seul l'identifiant technique de la dernière modification est appliqué à tout le groupe.
     Modification inplace du df source
 
     Retour:
@@ -656,34 +1076,195 @@ def regroupement_marche(df: pd.DataFrame, dict_modification: dict) -> pd.DataFra
     """
     df["idtech"] = ""
     subdata_modif = df[df.booleanModification == 1]  # Tout les marchés avec les modifications
-    liste_objet = list(subdata_modif.objet.unique())
-    df_to_concatene = pd.DataFrame()  # df vide pour la concaténation
-    logger.info("Au total, {} marchés sont concernés par au moins une modification".format(len(liste_objet)))
-    for objet_marche in liste_objet:
-        # Récupération du dataframe modification et du dataframe source
-        marche, marche_init = split_dataframe(df, subdata_modif, objet_marche)
-        for j in range(len(marche)):
-            marche_init = fusion_source_modification(marche.iloc[j], marche_init, dict_modification.keys(),
-                                                     dict_modification)
-        marche_init["idtech"] = marche.iloc[-1].id_technique
-        df_to_concatene = pd.concat([df_to_concatene, marche_init], copy=False)
-    df.update(df_to_concatene)
+    subdata_modif = subdata_modif.sort_values(by=["objet", "id"], kind="mergesort")
+    logger.info("Au total, {} marchés sont concernés par au moins une modification".format(
+        subdata_modif.objet.nunique()))
+    # Par objet: date de publication de la première modification et identifiant technique de la dernière
+    premiere_modification = subdata_modif.drop_duplicates(subset="objet", keep="first").set_index("objet")
+    derniere_modification = subdata_modif.drop_duplicates(subset="objet", keep="last").set_index("objet")
+    date_reference = df.objet.map(premiere_modification.datePublicationDonnees)
+    dans_marche_modifie = (df.datePublicationDonnees == date_reference).fillna(False).to_numpy(dtype=bool)
+    # Lignes de modification du groupe (objet, datePublicationDonnees) de référence
+    modification_du_marche = dans_marche_modifie & (df.booleanModification == 1).to_numpy(dtype=bool)
+
+    for col, col_init in dict_modification.items():
+        if col not in df.columns:
+            continue
+        nouvelles_valeurs = df[col]
+        if col_init not in df.columns:
+            df[col_init] = np.nan
+        if pd.api.types.is_numeric_dtype(df[col_init]):
+            nouvelles_valeurs = pd.to_numeric(nouvelles_valeurs.replace("", np.nan), errors="coerce")
+        masque = modification_du_marche & (df[col] != "").to_numpy(dtype=bool) & \
+            nouvelles_valeurs.notna().to_numpy(dtype=bool)
+        df.loc[masque, col_init] = nouvelles_valeurs[masque]
+
+    idtech = df.objet.map(derniere_modification.id_technique)
+    df.loc[dans_marche_modifie, "idtech"] = idtech[dans_marche_modifie]
     # Attention aux id.
     df["idMarche"] = np.where(df.idtech != "", df.idtech, df.id_technique)
     return df
 
 
-def manage_modifications(data: dict) -> pd.DataFrame:
+def aplatissement_marche(marche: dict, prefixe: str = ""):
+    """
+    Renvoie les couples (colonne, valeur) d'un marché, les dictionnaires imbriqués étant aplatis comme le fait
+    json_normalize (ex: lieuExecution.code).
+
+    Retour:
+        - generator de tuple
+    """
+    for cle, valeur in marche.items():
+        if isinstance(valeur, dict):
+            yield from aplatissement_marche(valeur, prefixe + cle + ".")
+        else:
+            yield prefixe + cle, valeur
+
+
+def conversion_entier(valeur):
+    """
+    Conversion d'une valeur json en entier. None ou "" correspondent à une valeur manquante.
+    Lève une ValueError si la valeur n'est pas un entier (ex: 12.5, "douze", true).
+    """
+    if valeur is None or valeur == "":
+        return None
+    if isinstance(valeur, bool) or not isinstance(valeur, (int, float, str)):
+        raise ValueError(f"{valeur!r} n'est pas un entier")
+    valeur_float = float(valeur)
+    if not valeur_float.is_integer():
+        raise ValueError(f"{valeur!r} n'est pas un entier")
+    return int(valeur_float)
+
+
+def conversion_decimal(valeur):
+    """
+    Conversion d'une valeur json en float. None ou "" correspondent à une valeur manquante.
+    Lève une ValueError si la valeur n'est pas numérique.
+    """
+    if valeur is None or valeur == "":
+        return np.nan
+    if isinstance(valeur, bool) or not isinstance(valeur, (int, float, str)):
+        raise ValueError(f"{valeur!r} n'est pas un nombre")
+    return float(valeur)
+
+
+def conversion_texte(valeur):
+    """
+    Conversion d'une valeur json en texte, à l'identique de astype("string").
+    """
+    if valeur is None or isinstance(valeur, str):
+        return valeur
+    return str(valeur)
+
+
+# Pour chaque type de var_glob.json: (fonction de conversion, dtype du tampon, valeur manquante)
+CONVERSIONS = {
+    "int64": (conversion_entier, np.int64, 0),
+    "float64": (conversion_decimal, np.float64, np.nan),
+    "string": (conversion_texte, object, None),
+    "category": (conversion_texte, object, None),
+    "object": (None, object, None),
+}
+
+
+def creation_colonnes_typees(marches: list, type_col: dict, quarantaine=None) -> pd.DataFrame:
+    """
+    Aplatit une liste de marchés en DataFrame en remplissant directement des tampons typés selon type_col
+    (type_col_nettoyage de var_glob.json). Les colonnes hors schéma sont conservées en object.
+    Un marché dont une valeur ne peut pas être convertie, ou qui n'est pas un objet json, est écrit dans le fichier
+    quarantaine (une ligne json par marché) et n'est pas inclus dans le DataFrame.
+    Les colonnes int64 contenant des valeurs manquantes sont renvoyées en Int64 (entier nullable).
+
+    Retour:
+        pd.DataFrame
+    """
+    nb_marches = len(marches)
+    tampons = {}
+    valeurs_manquantes = {}
+
+    def creation_tampon(col):
+        conversion, dtype, valeur_manquante = CONVERSIONS.get(type_col.get(col, "object"), CONVERSIONS["object"])
+        tampons[col] = np.full(nb_marches, valeur_manquante, dtype=dtype)
+        if dtype == np.int64:
+            # Masque des valeurs manquantes pour les entiers
+            valeurs_manquantes[col] = np.ones(nb_marches, dtype=bool)
+        return conversion
+
+    conversions = {col: creation_tampon(col) for col in type_col}
+    nb_lignes = 0
+    nb_quarantaine = 0
+    for marche in marches:
+        col = None
+        try:
+            if not isinstance(marche, dict):
+                raise TypeError(f"Marché de type {type(marche).__name__} au lieu d'un objet json")
+            ligne = []
+            for col, valeur in aplatissement_marche(marche):
+                if col not in conversions:
+                    conversions[col] = creation_tampon(col)
+                conversion = conversions[col]
+                ligne += [(col, conversion(valeur) if conversion else valeur)]
+        except (ValueError, TypeError, AttributeError) as erreur:
+            nb_quarantaine += 1
+            if quarantaine is not None:
+                quarantaine.write(json.dumps({"colonne": col, "erreur": str(erreur), "marche": marche},
+                                             ensure_ascii=False) + "\n")
+            continue
+        for col, valeur in ligne:
+            if col in valeurs_manquantes:
+                if valeur is None:
+                    continue
+                valeurs_manquantes[col][nb_lignes] = False
+            tampons[col][nb_lignes] = valeur
+        nb_lignes += 1
+    if nb_quarantaine:
+        logger.warning(f"{nb_quarantaine} marché(s) mis en quarantaine: marchés mal formés ou valeurs non conformes à "
+                       f"type_col_nettoyage")
+
+    colonnes = {}
+    for col, tampon in tampons.items():
+        tampon = tampon[:nb_lignes]
+        type_colonne = type_col.get(col, "object")
+        if col in valeurs_manquantes:
+            masque = valeurs_manquantes[col][:nb_lignes]
+            colonnes[col] = pd.arrays.IntegerArray(tampon, masque) if masque.any() else tampon
+        elif type_colonne in ("string", "category"):
+            colonnes[col] = pd.array(tampon, dtype=type_colonne)
+        else:
+            colonnes[col] = tampon
+    return pd.DataFrame(colonnes)
+
+
+def manage_modifications(lots) -> pd.DataFrame:
     """
-    Conversion du json en pandas et incorporation des modifications
+    Conversion du json en pandas et incorporation des modifications.
+    lots est un itérable de listes de marchés (cf lecture_marches). Chaque lot est converti séparément, ce qui évite
+    de garder en mémoire l'ensemble des marchés au format json.
 
     Retour:
         pd.DataFrame
     """
-    l_indice = indice_marche_avec_modification(data)
-    dict_modification = recuperation_colonne_a_modifier(data, l_indice)
-    df = json_normalize(data['marches'])
-    df = df.astype(conf_glob["nettoyage"]['type_col_nettoyage'], copy=False)
+    type_col_nettoyage = conf_glob["nettoyage"]['type_col_nettoyage']
+    dict_modification = {}
+    liste_df = []
+    nb_marches = 0
+    # En exécution incrémentale, les identifiants techniques suivent ceux des lignes de l'état précédent
+    premier_id_technique = incremental.premier_id_technique() if incremental.est_actif() else 0
+    with open(conf_glob["nettoyage"]["fichier_quarantaine"], 'w', encoding='utf-8') as quarantaine:
+        for marches in lots:
+            l_indice = indice_marche_avec_modification(marches, premier_id_technique + nb_marches)
+            dict_modification.update(recuperation_colonne_a_modifier(marches, l_indice))
+            liste_df += [creation_colonnes_typees(marches, type_col_nettoyage, quarantaine)]
+            nb_marches += len(marches)
+            logger.info(f"{nb_marches} marchés convertis")
+    if incremental.est_actif():
+        incremental.enregistrement_id_technique(premier_id_technique + nb_marches)
+    if not liste_df:
+        raise ValueError("Aucun marché n'a été trouvé dans le fichier decp.json")
+    df = pd.concat(liste_df, ignore_index=True, copy=False)
+    del liste_df
+    if df.empty:
+        return df
     prise_en_compte_modifications(df)
     df = regroupement_marche(df, dict_modification)
     return df
@@ -0,0 +1,253 @@
+import json
+import os
+import logging
+import re
+import sqlite3
+import numpy as np
+import pandas as pd
+import utils
+
+with open(os.path.join("confs", "config_data.json")) as f:
+    conf_data = json.load(f)
+
+with open(os.path.join("confs", "var_glob.json")) as f:
+    conf_glob = json.load(f)
+conf_sirene = conf_glob["sirene"]
+
+logger = logging.getLogger("main.sirene")
+logger.setLevel(logging.DEBUG)
+
+path_to_data = conf_data["path_to_data"]
+chemin_stock_etablissements = os.path.join(path_to_data, conf_data["base_sirene_insee"])
+chemin_base = os.path.join(conf_sirene["dossier"], "etablissements.sqlite")
+# Fichiers de mise à jour de l'Insee (établissements créés ou modifiés depuis une date), au format du stock
+dossier_mises_a_jour = os.path.join(path_to_data, conf_sirene["dossier_mises_a_jour"])
+# Version du format de la base, incluse dans sa signature: un changement de format force la reconstruction
+version_base = 2
+
+# Colonnes de StockEtablissement_utf8 conservées dans la base (celles utilisées par l'enrichissement).
+# siret et siren sont enregistrés en entiers, comme les clefs de nettoyage.canonicalisation_identifiants
+colonnes_etablissements = [
+    'siret',
+    'siren',
+    'nic',
+    'etablissementSiege',
+    'typeVoieEtablissement',
+    'libelleVoieEtablissement',
+    'codePostalEtablissement',
+    'libelleCommuneEtablissement',
+    'codeCommuneEtablissement',
+    'activitePrincipaleEtablissement',
+    'nomenclatureActivitePrincipaleEtablissement']
+
+
+def mise_a_jour_base():
+    """
+    Mise à jour de la base SQLite des établissements:
+        - construction complète à partir de StockEtablissement_utf8 si la base n'existe pas, si son format
+          (version_base) n'est plus celui du code, ou si le fichier stock a changé depuis sa construction (taille et
+          date de modification, cf utils.signature_fichiers). Sans fichier stock, une base au bon format est conservée;
+          une base à l'ancien format ne peut pas être utilisée
+        - puis application des fichiers de mise à jour pas encore appliqués (cf application_mises_a_jour)
+    La table etablissements a pour clef primaire le siret (entier) et un index secondaire sur le siren (recherche des
+    sièges sociaux).
+    """
+    signature = f"{version_base}|{utils.signature_fichiers([chemin_stock_etablissements])}"
+    if not os.path.exists(chemin_base):
+        construction_base(signature)
+    else:
+        signature_base = lecture_signature_base()
+        stock_present = os.path.exists(chemin_stock_etablissements)
+        if signature_base.split("|", 1)[0] != str(version_base):
+            if not stock_present:
+                raise ValueError(f"La base SIRENE {chemin_base} n'est plus au format attendu (version {version_base}) "
+                                 f"et le fichier {chemin_stock_etablissements} n'a pas été trouvé pour la "
+                                 f"reconstruire: télécharger le stock (SIRENE_STOCK_COMPLET=1 dans get-data-weekly.sh)")
+            logger.info("Base SIRENE à l'ancien format: reconstruction")
+            construction_base(signature)
+        elif signature_base != signature and stock_present:
+            construction_base(signature)
+        elif signature_base != signature:
+            logger.info("Fichier stock absent: la base SIRENE des établissements existante est conservée")
+        else:
+            logger.info("Base SIRENE des établissements construite à partir du dernier stock")
+    application_mises_a_jour()
+
+
+def lecture_signature_base() -> str:
+    """
+    Signature de la base existante: "version_base|signature du fichier stock"
+
+    Retour:
+        str
+    """
+    with sqlite3.connect(chemin_base) as connexion:
+        signature_base = connexion.execute("SELECT valeur FROM meta WHERE clef = 'signature'").fetchone()[0]
+    connexion.close()
+    return signature_base
+
+
+def base_utilisable() -> bool:
+    """
+    Indique si la base existe au format attendu par le code: le fichier stock n'est alors pas nécessaire
+
+    Retour:
+        bool
+    """
+    return os.path.exists(chemin_base) and lecture_signature_base().split("|", 1)[0] == str(version_base)
+
+
+def construction_base(signature: str):
+    """
+    Construction complète de la base à partir de StockEtablissement_utf8. Les fichiers de mise à jour dont la date (dans
+    le nom du fichier) est antérieure à la date d'extraction du stock (plus grande dateDernierTraitementEtablissement)
+    y sont déjà intégrés: ils sont enregistrés comme appliqués. Les autres, ou tous si l'une des dates est inconnue,
+    sont rejoués sur la base (INSERT OR REPLACE, sans effet pour un établissement inchangé).
+    La base est construite dans un fichier temporaire: une construction interrompue ne laisse jamais de base incomplète.
+    """
+    logger.info("Début du traitement: Construction de la base SIRENE des établissements")
+    os.makedirs(conf_sirene["dossier"], exist_ok=True)
+    chemin_temporaire = chemin_base + ".tmp"
+    if os.path.exists(chemin_temporaire):
+        os.remove(chemin_temporaire)
+    connexion = sqlite3.connect(chemin_temporaire)
+    connexion.execute("PRAGMA journal_mode = OFF")
+    connexion.execute("PRAGMA synchronous = OFF")
+    colonnes_texte = [f"{col} TEXT" for col in colonnes_etablissements if col not in ("siret", "siren")]
+    connexion.execute(f"CREATE TABLE etablissements (siret INTEGER PRIMARY KEY, siren INTEGER, "
+                      f"{', '.join(colonnes_texte)}) WITHOUT ROWID")
+    nb_lignes, date_stock = insertion_etablissements(connexion, chemin_stock_etablissements, "INSERT OR IGNORE")
+    connexion.execute("CREATE INDEX index_siren ON etablissements (siren)")
+    connexion.execute("CREATE TABLE meta (clef TEXT PRIMARY KEY, valeur TEXT)")
+    connexion.execute("INSERT INTO meta VALUES ('signature', ?)", (signature,))
+    connexion.execute("CREATE TABLE mises_a_jour (fichier TEXT PRIMARY KEY, signature TEXT)")
+    if date_stock is not None:
+        connexion.executemany("INSERT INTO mises_a_jour VALUES (?, ?)", [
+            (chemin, utils.signature_fichiers([chemin])) for chemin in fichiers_mises_a_jour()
+            if date_mise_a_jour(chemin) is not None and date_mise_a_jour(chemin) < date_stock])
+    connexion.commit()
+    connexion.close()
+    os.replace(chemin_temporaire, chemin_base)
+    logger.info(f"Base SIRENE construite: {nb_lignes} établissement(s) lu(s)")
+
+
+def insertion_etablissements(connexion: sqlite3.Connection, chemin: str, commande: str) -> tuple:
+    """
+    Insertion par blocs des établissements d'un fichier au format StockEtablissement_utf8 dans la table etablissements.
+    commande vaut "INSERT OR IGNORE" (construction: le premier établissement lu est conservé) ou "INSERT OR REPLACE"
+    (mise à jour: l'établissement existant est remplacé).
+
+    Retour:
+        tuple:
+            - int: nombre de lignes lues
+            - str: plus grande dateDernierTraitementEtablissement du fichier (AAAA-MM-JJ), None si absente
+    """
+    requete = f"{commande} INTO etablissements VALUES ({', '.join(['?'] * len(colonnes_etablissements))})"
+    colonnes_lues = colonnes_etablissements + ["dateDernierTraitementEtablissement"]
+    nb_lignes = 0
+    date_max = None
+    for gm_chunk in pd.read_csv(chemin, chunksize=conf_sirene["taille_lot"], sep=',', encoding='utf-8',
+                                usecols=lambda col: col in colonnes_lues, dtype=str):
+        dates = gm_chunk.get("dateDernierTraitementEtablissement", pd.Series(dtype=str)).dropna()
+        if not dates.empty:
+            date_max = max(date_max or "", dates.max()[:10])
+        gm_chunk = gm_chunk[colonnes_etablissements].astype({"siret": np.int64, "siren": np.int64})
+        # Les valeurs manquantes sont enregistrées en NULL
+        connexion.executemany(requete, gm_chunk.astype(object).where(gm_chunk.notna(), None).itertuples(
+            index=False, name=None))
+        nb_lignes += len(gm_chunk)
+    return nb_lignes, date_max
+
+
+def date_mise_a_jour(chemin: str) -> str:
+    """
+    Date d'un fichier de mise à jour, lue dans son nom (AAAA-MM-JJ, ex: etablissements_2021-03-08.csv). None si le nom
+    ne contient pas de date.
+
+    Retour:
+        str
+    """
+    date = re.search(r"\d{4}-\d{2}-\d{2}", os.path.basename(chemin))
+    return date.group(0) if date else None
+
+
+def fichiers_mises_a_jour() -> list:
+    """
+    Fichiers csv du dossier des mises à jour, dans l'ordre de leur nom (à dater, ex: etablissements_2021-03-08.csv)
+
+    Retour:
+        list
+    """
+    if not os.path.isdir(dossier_mises_a_jour):
+        return []
+    return [os.path.join(dossier_mises_a_jour, fichier) for fichier in sorted(os.listdir(dossier_mises_a_jour))
+            if fichier.endswith(".csv")]
+
+
+def application_mises_a_jour():
+    """
+    Application à la base, dans l'ordre de leur nom, des fichiers de mise à jour de l'Insee (établissements créés ou
+    modifiés) qui n'ont pas encore été appliqués: chaque établissement est inséré ou remplace l'existant. Le coût est
+    celui du fichier de mise à jour, pas celui du stock.
+    Chaque fichier est appliqué dans une transaction, avec son enregistrement dans la table mises_a_jour: un fichier
+    modifié depuis son application est appliqué de nouveau.
+    """
+    connexion = sqlite3.connect(chemin_base)
+    connexion.execute("CREATE TABLE IF NOT EXISTS mises_a_jour (fichier TEXT PRIMARY KEY, signature TEXT)")
+    appliques = dict(connexion.execute("SELECT fichier, signature FROM mises_a_jour").fetchall())
+    for chemin in fichiers_mises_a_jour():
+        signature = utils.signature_fichiers([chemin])
+        if appliques.get(chemin) == signature:
+            continue
+        with connexion:
+            nb_lignes, _ = insertion_etablissements(connexion, chemin, "INSERT OR REPLACE")
+            connexion.execute("INSERT OR REPLACE INTO mises_a_jour VALUES (?, ?)", (chemin, signature))
+        logger.info(f"Mise à jour de la base SIRENE: {nb_lignes} établissement(s) de {chemin} appliqué(s)")
+    connexion.close()
+
+
+def recherche(colonne: str, valeurs: np.ndarray, colonnes: list, condition: str = "") -> pd.DataFrame:
+    """
+    Recherche dans la table etablissements des lignes dont la colonne indexée (siret ou siren) est dans valeurs
+    (clefs entières). Les colonnes siret et siren renvoyées sont de type uint64 et uint32.
+    Les valeurs sont chargées dans une table temporaire jointe à la table etablissements: chaque valeur est une
+    recherche dans l'index, sans parcours de la base.
+
+    Retour:
+        - pd.DataFrame
+    """
+    with sqlite3.connect(chemin_base) as connexion:
+        connexion.execute("CREATE TEMP TABLE valeurs (valeur INTEGER PRIMARY KEY) WITHOUT ROWID")
+        connexion.executemany("INSERT OR IGNORE INTO valeurs VALUES (?)", ((int(valeur),) for valeur in valeurs))
+        result = pd.read_sql_query(
+            f"SELECT {', '.join('e.' + col for col in colonnes)} FROM valeurs v "
+            f"JOIN etablissements e ON e.{colonne} = v.valeur {condition}", connexion)
+    connexion.close()
+    # Comme pour une lecture du csv, les valeurs manquantes sont des NaN
+    result = result.where(result.notna(), np.nan)
+    return result.astype({col: type_col for col, type_col in {"siret": np.uint64, "siren": np.uint32}.items()
+                          if col in colonnes})
+
+
+def recherche_etablissements(sirets: np.ndarray, colonnes: list) -> pd.DataFrame:
+    """
+    Etablissements dont le siret (uint64) est dans sirets, restreints aux colonnes demandées
+
+    Retour:
+        - pd.DataFrame
+    """
+    return recherche("siret", sirets, colonnes)
+
+
+def recherche_sieges(sirens: np.ndarray, colonnes: list) -> pd.DataFrame:
+    """
+    Sièges sociaux des entreprises dont le siren (uint32) est dans sirens (index secondaire sur le siren)
+
+    Retour:
+        - pd.DataFrame
+    """
+    return recherche("siren", sirens, colonnes, condition="WHERE e.etablissementSiege = 'true'")
+
+
+if __name__ == "__main__":
+    mise_a_jour_base()
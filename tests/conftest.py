@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# Les modules lisent leur configuration dans confs/ relativement au dossier courant
+dossier_projet = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(dossier_projet)
+sys.path.insert(0, dossier_projet)
+
+import incremental  # noqa: E402
+import nettoyage  # noqa: E402
+
+
+@pytest.fixture
+def quarantaine(tmp_path, monkeypatch):
+    """Fichier de quarantaine de manage_modifications dans un dossier temporaire"""
+    chemin = tmp_path / "marches_quarantaine.json"
+    monkeypatch.setitem(nettoyage.conf_glob["nettoyage"], "fichier_quarantaine", str(chemin))
+    return chemin
+
+
+@pytest.fixture
+def etat_incremental(tmp_path, monkeypatch, quarantaine):
+    """Exécution incrémentale active, avec un état dans un dossier temporaire"""
+    dossier = tmp_path / "etat_incremental"
+    monkeypatch.setitem(incremental.conf_incremental, "actif", True)
+    monkeypatch.setattr(incremental, "dossier_etat", str(dossier))
+    for nom in ["fichier_empreintes", "fichier_lignes", "fichier_empreintes_lignes", "fichier_empreintes_en_cours",
+                "fichier_empreintes_lignes_en_cours", "fichier_id_technique", "fichier_id_technique_en_cours"]:
+        monkeypatch.setattr(incremental, nom, str(dossier / os.path.basename(getattr(incremental, nom))))
+    return dossier
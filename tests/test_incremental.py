@@ -0,0 +1,67 @@
+import os
+
+import pandas as pd
+
+import incremental
+import nettoyage
+
+
+def marche(uid: str, objet: str) -> dict:
+    return {"uid": uid, "id": uid, "objet": objet, "datePublicationDonnees": "2021-01-01", "montant": 1000.0,
+            "acheteur": {"id": "21750001600019", "nom": "Ville"}}
+
+
+def execution(marches: list):
+    """Lecture incrémentale puis fusion avec l'état précédent, sans les étapes intermédiaires"""
+    df = nettoyage.manage_modifications(incremental.filtre_marches_modifies([marches]))
+    return incremental.fusion_etat_precedent(df.reindex(columns=["idMarche", "objet", "empreinteMarche"]))
+
+
+def test_id_marche_unique_apres_fusion(etat_incremental):
+    premiere = execution([marche("a", "objet a"), marche("b", "objet b")])
+    assert premiere.idMarche.is_unique
+
+    # b est modifié, c est nouveau: a est repris de l'état précédent
+    seconde = execution([marche("a", "objet a"), marche("b", "objet b modifié"), marche("c", "objet c")])
+    assert sorted(seconde.objet) == ["objet a", "objet b modifié", "objet c"]
+    assert seconde.idMarche.is_unique
+    # L'identifiant de la ligne reprise n'est pas modifié
+    assert (seconde.set_index("objet").idMarche["objet a"] == premiere.set_index("objet").idMarche["objet a"])
+
+
+def test_marche_modifie(etat_incremental):
+    execution([marche("a", "objet a"), marche("b", "objet b")])
+    seconde = execution([marche("a", "objet a"), marche("b", "objet b modifié")])
+
+    # L'ancienne version de b est remplacée
+    assert sorted(seconde.objet) == ["objet a", "objet b modifié"]
+    # L'état enregistré (Parquet) est celui de la seconde exécution
+    assert sorted(pd.read_parquet(incremental.fichier_lignes).objet) == ["objet a", "objet b modifié"]
+
+
+def test_marche_supprime(etat_incremental):
+    execution([marche("a", "objet a"), marche("b", "objet b")])
+    seconde = execution([marche("a", "objet a")])
+    assert seconde.objet.tolist() == ["objet a"]
+
+    # b n'est pas repris par les exécutions suivantes
+    troisieme = execution([marche("a", "objet a"), marche("c", "objet c")])
+    assert sorted(troisieme.objet) == ["objet a", "objet c"]
+
+
+def test_execution_sans_marche_modifie(etat_incremental):
+    premiere = execution([marche("a", "objet a"), marche("b", "objet b")])
+    seconde = execution([marche("a", "objet a"), marche("b", "objet b")])
+
+    # Aucun marché traité: les lignes de l'état précédent sont reprises à l'identique
+    pd.testing.assert_frame_equal(seconde.sort_values("objet", ignore_index=True),
+                                  premiere.sort_values("objet", ignore_index=True), check_dtype=False)
+    assert seconde.dtypes.equals(pd.read_parquet(incremental.fichier_lignes).dtypes)
+
+
+def test_etat_sans_lignes(etat_incremental):
+    execution([marche("a", "objet a")])
+    # Etat incomplet (ex: lignes à un ancien format): tous les marchés sont de nouveau traités
+    os.remove(incremental.fichier_lignes)
+    seconde = execution([marche("a", "objet a"), marche("b", "objet b")])
+    assert sorted(seconde.objet) == ["objet a", "objet b"]
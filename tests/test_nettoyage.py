@@ -0,0 +1,236 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import incremental
+import nettoyage
+
+
+def marche(uid: str, **valeurs) -> dict:
+    return dict({"uid": uid, "id": uid, "objet": f"objet {uid}", "datePublicationDonnees": "2021-01-01",
+                 "montant": 1000.0, "acheteur": {"id": "21750001600019", "nom": "Ville"}}, **valeurs)
+
+
+def lecture_quarantaine(chemin) -> list:
+    with open(chemin, encoding="utf-8") as f:
+        return [json.loads(ligne) for ligne in f]
+
+
+def test_quarantaine_marches_mal_formes(quarantaine, monkeypatch):
+    monkeypatch.setitem(incremental.conf_incremental, "actif", False)
+    marches = [marche("a"), "texte", marche("b", montant="beaucoup"), [1, 2], None, marche("c")]
+    df = nettoyage.manage_modifications([marches])
+
+    assert sorted(df.objet) == ["objet a", "objet c"]
+    lignes = lecture_quarantaine(quarantaine)
+    assert [ligne["marche"] for ligne in lignes] == marches[1:5]
+    # La colonne en cause est celle du marché mis en quarantaine, pas la dernière colonne du marché précédent
+    assert [ligne["colonne"] for ligne in lignes] == [None, "montant", None, None]
+    assert "str" in lignes[0]["erreur"]
+
+
+def test_quarantaine_execution_incrementale(etat_incremental, quarantaine):
+    df = nettoyage.manage_modifications(incremental.filtre_marches_modifies([[marche("a"), 12, marche("b")]]))
+
+    assert sorted(df.objet) == ["objet a", "objet b"]
+    assert [ligne["marche"] for ligne in lecture_quarantaine(quarantaine)] == [12]
+
+
+def test_repartition_echantillon():
+    # Les arrondis des quotas (3.4, 3.3, 3.3) donneraient 9 marchés
+    assert nettoyage.repartition_echantillon({"a": 34, "b": 33, "c": 33}, 10) == {"a": 4, "b": 3, "c": 3}
+    # Chaque strate est représentée, sans dépasser le nombre demandé
+    assert nettoyage.repartition_echantillon({"a": 97, "b": 2, "c": 1}, 10) == {"a": 8, "b": 1, "c": 1}
+    assert nettoyage.repartition_echantillon({"a": 1, "b": 1, "c": 1}, 2) == {"a": 1, "b": 1, "c": 0}
+    assert nettoyage.repartition_echantillon({"a": 3, "b": 2}, 10) == {"a": 3, "b": 2}
+
+
+def test_echantillonnage_strate():
+    marches = [marche(str(i), source=source) for i, source in enumerate(["x"] * 34 + ["y"] * 33 + ["z"] * 33)]
+    echantillon, = nettoyage.echantillonnage_marches([marches], nombre=10, strate="source", graine=1)
+
+    assert len(echantillon) == 10
+    assert sorted(element["source"] for element in echantillon) == ["x"] * 4 + ["y"] * 3 + ["z"] * 3
+
+
+def regroupement_ligne_a_ligne(df, dict_modification):
+    """Version ligne à ligne de regroupement_marche (split_dataframe et fusion_source_modification)"""
+    df = df.copy()
+    df["idtech"] = ""
+    subdata_modif = df[df.booleanModification == 1]
+    for objet in subdata_modif.objet.unique():
+        marche = subdata_modif[subdata_modif.objet == objet].sort_values(by="id", kind="mergesort")
+        marche_init = df[(df.objet == objet) & (df.datePublicationDonnees == marche.datePublicationDonnees.iloc[0])]
+        for indice, ligne in marche.iterrows():
+            for col, col_init in dict_modification.items():
+                if indice in marche_init.index and ligne[col] != "":
+                    df.at[indice, col_init] = ligne[col]
+        df.loc[marche_init.index, "idtech"] = marche.iloc[-1].id_technique
+    df["idMarche"] = np.where(df.idtech != "", df.idtech, df.id_technique)
+    return df
+
+
+def test_regroupement_marche_ligne_a_ligne():
+    # Objet "a": trois modifications, dont une publiée à une autre date, et une ligne non modifiée dans le groupe
+    df = pd.DataFrame({
+        "objet": ["a", "a", "a", "a", "b", "b", "c"],
+        "id": ["1", "2", "3", "4", "5", "6", "7"],
+        "datePublicationDonnees": ["2021-01-01", "2021-01-01", "2021-02-01", "2021-01-01", "2021-03-01",
+                                   "2021-03-01", "2021-04-01"],
+        "booleanModification": [1, 1, 1, 0, 0, 1, 0],
+        "id_technique": [0, 1, 2, 3, 4, 5, 6],
+        "montant": [10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0],
+        "montantModification": [15.5, "", 35, "", "", 65, ""],
+        "dureeMois": pd.array([1, 2, 3, 4, 5, 6, 7], dtype="Int64"),
+        "dureeMoisModification": ["", 12, 24, "", "", "", ""],
+        "titulaires": [["t1"], ["t2"], ["t3"], ["t4"], ["t5"], ["t6"], ["t7"]],
+        "titulairesModification": [["m1"], "", ["m3"], "", "", "", ""],
+    })
+    dict_modification = {"montantModification": "montant", "dureeMoisModification": "dureeMois",
+                         "titulairesModification": "titulaires"}
+    attendu = regroupement_ligne_a_ligne(df, dict_modification)
+    resultat = nettoyage.regroupement_marche(df.copy(), dict_modification)
+
+    assert resultat.montant.tolist() == [15.5, 20.0, 30.0, 40.0, 50.0, 65.0, 70.0]
+    assert resultat.montant.astype(float).tolist() == attendu.montant.astype(float).tolist()
+    assert resultat.dureeMois.astype(int).tolist() == attendu.dureeMois.astype(int).tolist()
+    assert resultat.titulaires.tolist() == attendu.titulaires.tolist()
+    assert resultat.idMarche.tolist() == attendu.idMarche.tolist() == [2, 2, 2, 2, 5, 5, 6]
+
+
+def test_is_false_amount_vectorise():
+    montants = np.array([999999, 222262, 2222262, 111110.99, -7777770, 0, 1e18 - 1, 3.3333339e18, 5e25, 100.5,
+                         12345678901, 666660, 999999])
+    attendu = [nettoyage.is_false_amount(montant) for montant in montants]
+    assert nettoyage.is_false_amount_vectorise(montants).tolist() == attendu
+    assert attendu[:5] == [True, False, True, False, True]
+    # Les montants non finis ne sont jamais considérés comme faux
+    assert not nettoyage.is_false_amount_vectorise(np.array([np.nan, np.inf])).any()
+
+
+@pytest.mark.parametrize("montant, nb_titulaires, montant_calcule, motif", [
+    (np.nan, 1, 0, "montant_manquant"),
+    (999999, 1, 0, "chiffre_repete"),
+    (200, 1, 0, "inferieur_borne_inf"),
+    (200.5, 1, 200.5, "aucune"),
+    (400, 2, 0, "inferieur_borne_inf"),
+    (-5000, 1, 5000, "aucune"),
+    (9.99e8, 1, 0, "superieur_borne_sup"),
+    (9.98e8, 1, 9.98e8, "aucune"),
+    (1.5e9, 2, 7.5e8, "aucune"),
+])
+def test_regles_montant(montant, nb_titulaires, montant_calcule, motif):
+    df = pd.DataFrame({"montant": [montant], "nbTitulairesSurCeMarche": [nb_titulaires]})
+    df = nettoyage.manage_amount(df)
+    assert df.montantCalcule.tolist() == [montant_calcule]
+    assert df.motifCorrectionMontant.tolist() == [motif]
+
+
+@pytest.mark.parametrize("montant, duree, duree_calculee, motif", [
+    (500, 500, 17, "duree_egale_montant"),
+    (9900, 100, 3, "ratio_montant_duree_100"),
+    (10000, 100, 3, "ratio_montant_duree_1000"),
+    (11988, 12, 1, "ratio_montant_duree_1000"),
+    (12000, 12, 12, "aucune"),
+    (1100, 11, 11, "aucune"),
+    (199999, 30, 1, "duree_30_31_jours"),
+    (200000, 31, 31, "aucune"),
+    (9999999, 365, 12, "duree_360_366_jours"),
+    (10000000, 366, 366, "aucune"),
+    (1999999, 121, 4, "duree_superieure_120"),
+    (1999999, 120, 120, "aucune"),
+    (2000000, 121, 121, "aucune"),
+    (50000, None, 1, "aucune"),
+])
+def test_regles_duree(montant, duree, duree_calculee, motif):
+    df = pd.DataFrame({"montantCalcule": [montant], "dureeMois": pd.array([duree], dtype="Int64")})
+    df = nettoyage.correct_date(df)
+    assert df.dureeMoisCalculee.tolist() == [duree_calculee]
+    assert df.motifCorrectionDuree.tolist() == [motif]
+    assert df.dureeMoisEstimee.tolist() == [motif != "aucune"]
+
+
+@pytest.fixture
+def referentiels(monkeypatch):
+    """Bases département et région de l'Insee réduites aux codes des tests"""
+    monkeypatch.setattr(nettoyage, "referentiel_departements", lambda: {
+        "75": ("11", "Paris"), "2A": ("94", "Corse-du-Sud"), "974": ("04", "La Réunion"), "21": ("27", "Côte-d'Or")})
+    monkeypatch.setattr(nettoyage, "referentiel_regions", lambda: {
+        "11": "Île-de-France", "94": "Corse", "04": "La Réunion", "27": "Bourgogne-Franche-Comté"})
+
+
+@pytest.mark.parametrize("code, type_code, attendu", [
+    ("75001", "Code postal", ("75", "11", "Paris", "Île-de-France")),
+    ("2A004", "Code commune", ("2A", "94", "Corse-du-Sud", "Corse")),
+    ("97411", "Code postal", ("974", "04", "La Réunion", "La Réunion")),
+    ("21000", "Code postal", ("21", "27", "Côte-d'Or", "Bourgogne-Franche-Comté")),
+    # Codes précédés d'une virgule et d'un espace dans code_reg et code_CP de var_glob.json
+    ("27", "Code région", ("nan", "27", np.nan, "Bourgogne-Franche-Comté")),
+    ("99", "Code région", ("nan", "nan", np.nan, np.nan)),
+    ("XX123", "Code postal", ("nan", "nan", np.nan, np.nan)),
+    (None, None, ("nan", "nan", np.nan, np.nan)),
+])
+def test_resolution_lieu_execution(referentiels, code, type_code, attendu):
+    resultat = nettoyage.resolution_lieu_execution(code, type_code)
+    assert resultat[:2] == attendu[:2]
+    assert [str(libelle) for libelle in resultat[2:]] == [str(libelle) for libelle in attendu[2:]]
+
+
+def test_codes_valides_sans_espaces():
+    assert {"27", "2B", "976", "75"} <= nettoyage.codes_valides("code_CP") | nettoyage.codes_valides("code_reg")
+    assert not any(code != code.strip() for code in nettoyage.codes_valides("code_CP"))
+
+
+def test_manage_region(referentiels):
+    codes = ["75001", "27", "75001", None, "27", "97411"]
+    types_code = ["Code postal", "Code région", "Code postal", None, "Code postal", "Code postal"]
+    df = nettoyage.manage_region(pd.DataFrame({"lieuExecution.code": codes, "lieuExecution.typeCode": types_code}))
+    # Chaque couple distinct est résolu une fois puis réparti: même résultat que ligne à ligne
+    attendu = [nettoyage.resolution_lieu_execution(code, type_code) for code, type_code in zip(codes, types_code)]
+    assert df.codeDepartementExecution.tolist() == [ligne[0] for ligne in attendu]
+    assert df.codeRegionExecution.tolist() == [ligne[1] for ligne in attendu]
+    assert df.libelleRegionExecution.astype(str).tolist() == [str(ligne[3]) for ligne in attendu]
+    assert df.codeRegionExecution.tolist() == ["11", "27", "11", "nan", "nan", "04"]
+
+
+@pytest.mark.parametrize("valeur, attendu", [
+    # utf-8 lu en cp1252
+    ("CafÃ© Ã\xa0 lâ€™Ã©cole", "Café à l’école"),
+    # utf-8 lu en latin-1 (0x81 n'existe pas en cp1252)
+    ("Ã\x81rbol", "Árbol"),
+    # Textes légitimes contenant Ã ou Â: non réparables, conservés
+    ("SÃO PAULO", "SÃO PAULO"),
+    ("Â bientôt", "Â bientôt"),
+    # Table de traduction et espaces superflus
+    ("  Mairie\tde\xa0Paris \n", "Mairie de Paris"),
+    ("R�fection", "RXXXXXfection"),
+])
+def test_normalisation_valeur_texte(valeur, attendu):
+    table = str.maketrans(nettoyage.conf_glob["nettoyage"]["normalisation_texte"]["caracteres"])
+    assert nettoyage.normalisation_valeur_texte(valeur, table) == attendu
+
+
+def test_normalisation_valeur_texte_casse():
+    table = str.maketrans({})
+    assert nettoyage.normalisation_valeur_texte("Ã©cole  Ouverte", table, "majuscule") == "ÉCOLE OUVERTE"
+    assert nettoyage.normalisation_valeur_texte("Ã©cole  Ouverte", table, "minuscule") == "école ouverte"
+
+
+def test_normalisation_texte():
+    df = pd.DataFrame({"objet": ["Travaux  Ã©cole", "Travaux école", None, "Voirie"]})
+    df = nettoyage.normalisation_texte(df)
+    assert isinstance(df.objet.dtype, pd.CategoricalDtype)
+    assert df.objet.astype(object).where(df.objet.notna(), None).tolist() == [
+        "Travaux école", "Travaux école", None, "Voirie"]
+    assert sorted(df.objet.cat.categories) == ["Travaux école", "Voirie"]
+
+
+def test_conversion_date():
+    serie = pd.Series(["2019-03-10", "2019-03-10T12:00:00+01:00", "2019", "2019-03", "2019-3-10", "2019-02-30",
+                       "10/03/2019", "", None], name="dateNotification")
+    dates = nettoyage.conversion_date(serie)
+    assert dates.dtype == "datetime64[ns]"
+    # Les dates tronquées ne sont pas complétées au premier du mois ou de l'année
+    assert dates.dt.strftime("%Y-%m-%d").tolist() == ["2019-03-10", "2019-03-10"] + [np.nan] * 7
@@ -0,0 +1,93 @@
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import sirene
+
+COLONNES = sirene.colonnes_etablissements + ["dateDernierTraitementEtablissement"]
+
+
+def etablissement(siret: str, siege: bool, commune: str, date: str) -> dict:
+    return {"siret": siret, "siren": siret[:9], "nic": siret[9:], "etablissementSiege": str(siege).lower(),
+            "typeVoieEtablissement": "RUE", "libelleVoieEtablissement": "DE LA PAIX",
+            "codePostalEtablissement": "75002",
+            "libelleCommuneEtablissement": commune, "codeCommuneEtablissement": "75102",
+            "activitePrincipaleEtablissement": "62.01Z", "nomenclatureActivitePrincipaleEtablissement": "NAFRev2",
+            "dateDernierTraitementEtablissement": date}
+
+
+def ecriture(chemin, etablissements: list):
+    pd.DataFrame(etablissements, columns=COLONNES).to_csv(chemin, index=False)
+
+
+@pytest.fixture
+def base_sirene(tmp_path, monkeypatch):
+    """Base SIRENE, fichier stock et dossier des mises à jour dans un dossier temporaire"""
+    monkeypatch.setitem(sirene.conf_sirene, "dossier", str(tmp_path / "sirene"))
+    monkeypatch.setattr(sirene, "chemin_base", str(tmp_path / "sirene" / "etablissements.sqlite"))
+    monkeypatch.setattr(sirene, "chemin_stock_etablissements", str(tmp_path / "StockEtablissement_utf8.csv"))
+    monkeypatch.setattr(sirene, "dossier_mises_a_jour", str(tmp_path / "mises_a_jour"))
+    (tmp_path / "mises_a_jour").mkdir()
+    # Stock extrait le 2026-10-10
+    ecriture(sirene.chemin_stock_etablissements, [
+        etablissement("55208131700014", True, "PARIS", "2026-10-10T08:00:00"),
+        etablissement("55208131799999", False, "LYON", "2026-09-01T08:00:00"),
+        etablissement("12345678900011", False, "LILLE", "2026-10-02T08:00:00")])
+    return tmp_path / "mises_a_jour"
+
+
+def communes(sirets: list) -> dict:
+    resultat = sirene.recherche_etablissements(np.array(sirets, dtype=np.uint64),
+                                               ["siret", "libelleCommuneEtablissement"])
+    return dict(zip(resultat.siret, resultat.libelleCommuneEtablissement))
+
+
+def test_construction_et_mises_a_jour(base_sirene):
+    # Mise à jour antérieure au stock (déjà intégrée) et postérieure (à appliquer)
+    ecriture(base_sirene / "etablissements_2026-10-05.csv", [etablissement("55208131799999", False, "ANCIEN", "")])
+    ecriture(base_sirene / "etablissements_2026-10-12.csv", [
+        etablissement("55208131700014", True, "PARIS 2E", "2026-10-12T08:00:00"),
+        etablissement("98765432100019", True, "NANTES", "2026-10-12T08:00:00")])
+    sirene.mise_a_jour_base()
+
+    assert sirene.base_utilisable()
+    assert communes([55208131700014, 55208131799999, 98765432100019, 11111111111111]) == {
+        55208131700014: "PARIS 2E", 55208131799999: "LYON", 98765432100019: "NANTES"}
+    sieges = sirene.recherche_sieges(np.array([552081317, 123456789], dtype=np.uint32),
+                                     ["siret", "siren", "libelleCommuneEtablissement"])
+    assert sieges.siret.tolist() == [55208131700014]
+    assert sieges.siren.dtype == np.uint32
+    assert sieges.libelleCommuneEtablissement.tolist() == ["PARIS 2E"]
+
+    # Une nouvelle mise à jour est appliquée sans reconstruire la base
+    ecriture(base_sirene / "etablissements_2026-10-19.csv", [etablissement("12345678900011", False, "ROUBAIX", "")])
+    with sqlite3.connect(sirene.chemin_base) as connexion:
+        connexion.execute("UPDATE etablissements SET libelleVoieEtablissement = 'MARQUEUR' "
+                          "WHERE siret = 55208131799999")
+    connexion.close()
+    sirene.mise_a_jour_base()
+    assert communes([12345678900011])[12345678900011] == "ROUBAIX"
+    voie = sirene.recherche_etablissements(np.array([55208131799999], dtype=np.uint64), ["libelleVoieEtablissement"])
+    assert voie.libelleVoieEtablissement.tolist() == ["MARQUEUR"]
+
+
+def test_base_ancien_format(base_sirene):
+    sirene.mise_a_jour_base()
+    with sqlite3.connect(sirene.chemin_base) as connexion:
+        connexion.execute("UPDATE meta SET valeur = '1|ancien' WHERE clef = 'signature'")
+    connexion.close()
+    assert not sirene.base_utilisable()
+
+    # Avec le fichier stock, la base est reconstruite
+    sirene.mise_a_jour_base()
+    assert sirene.base_utilisable()
+
+    # Sans fichier stock, une base à l'ancien format ne peut pas être utilisée
+    with sqlite3.connect(sirene.chemin_base) as connexion:
+        connexion.execute("UPDATE meta SET valeur = '1|ancien' WHERE clef = 'signature'")
+    connexion.close()
+    (base_sirene.parent / "StockEtablissement_utf8.csv").unlink()
+    with pytest.raises(ValueError, match="SIRENE_STOCK_COMPLET"):
+        sirene.mise_a_jour_base()
@@ -0,0 +1,18 @@
+import utils
+
+configuration = {"nettoyage": {"seuil": 10, "autre": 1}, "rapport": {"actif": True}}
+
+
+def etape(df):
+    return df[df.montant > configuration["nettoyage"]["seuil"]]
+
+
+def test_signature_code_clefs_lues(monkeypatch):
+    signature = utils.signature_code(etape)
+    # Une clef que l'étape ne lit pas ne change pas sa signature
+    monkeypatch.setitem(configuration["rapport"], "actif", False)
+    monkeypatch.setitem(configuration["nettoyage"], "autre", 2)
+    assert utils.signature_code(etape) == signature
+    # Une clef lue la change
+    monkeypatch.setitem(configuration["nettoyage"], "seuil", 20)
+    assert utils.signature_code(etape) != signature
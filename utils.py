@@ -0,0 +1,415 @@
+import ast
+import hashlib
+import inspect
+import json
+import logging
+import os
+import textwrap
+import time
+import tracemalloc
+import types
+from datetime import datetime
+from functools import partial
+import pandas as pd
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger("main.utils")
+logger.setLevel(logging.DEBUG)
+
+
+def ecriture_parquet(df: pd.DataFrame, chemin: str):
+    """
+    Ecriture du df au format Parquet, qui conserve les types des colonnes (string, Int64, category...).
+    Les colonnes object de types mélangés (ex: "" et des nombres dans les colonnes xxxModification, listes de
+    titulaires) ne sont pas représentables en Parquet: elles sont converties en texte, les valeurs manquantes
+    étant conservées.
+    """
+    df = df.reset_index(drop=True)
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        type_infere = pd.api.types.infer_dtype(df[col], skipna=True)
+        if type_infere not in ("string", "empty", "integer", "floating", "boolean", "date", "datetime", "bytes"):
+            logger.info(f"Colonne {col} ({type_infere}) convertie en texte pour l'écriture Parquet")
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    df.to_parquet(chemin, index=False)
+
+
+def conversion_booleen(serie: pd.Series) -> pd.Series:
+    """
+    Conversion d'une colonne de drapeaux (booléens ou textes "True"/"False") en booléens.
+    Le type nullable "boolean" est utilisé si la colonne contient des valeurs manquantes.
+
+    Retour:
+        pd.Series
+    """
+    if pd.api.types.is_bool_dtype(serie):
+        return serie
+    serie = serie.replace({"True": True, "False": False})
+    if serie.isna().any():
+        return serie.astype("boolean")
+    return serie.astype(bool)
+
+
+def optimisation_types(df: pd.DataFrame, type_col: dict) -> pd.DataFrame:
+    """
+    Réduction de l'empreinte mémoire du df selon le schéma type_col ({colonne: type}, cf optimisation_types de
+    var_glob.json). Les colonnes absentes du df sont ignorées. Types possibles:
+        - "category": colonnes textes à faible cardinalité. La conversion n'est conservée que si elle réduit la mémoire
+        - "bool": drapeaux, cf conversion_booleen
+        - "integer", "unsigned", "float": réduction au plus petit type numérique possible (pd.to_numeric)
+    Le gain mémoire est écrit dans les logs pour chaque colonne convertie.
+
+    Retour:
+        pd.DataFrame
+    """
+    memoire_totale = 0
+    for col, type_optimise in type_col.items():
+        if col not in df.columns:
+            continue
+        memoire_avant = df[col].memory_usage(index=False, deep=True)
+        if type_optimise == "category":
+            if pd.api.types.is_categorical_dtype(df[col]):
+                continue
+            serie = df[col].astype("category")
+        elif type_optimise == "bool":
+            serie = conversion_booleen(df[col])
+        elif type_optimise in ("integer", "unsigned", "float"):
+            if not pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col]):
+                continue
+            serie = pd.to_numeric(df[col], downcast=type_optimise)
+        else:
+            raise ValueError(f"Type d'optimisation inconnu pour la colonne {col}: {type_optimise}")
+        memoire_apres = serie.memory_usage(index=False, deep=True)
+        if serie.dtype == df[col].dtype or (type_optimise == "category" and memoire_apres >= memoire_avant):
+            continue
+        df[col] = serie
+        memoire_totale += memoire_avant - memoire_apres
+        logger.info(f"Colonne {col} convertie en {serie.dtype}: {(memoire_avant - memoire_apres) / 2 ** 20:.2f} Mo "
+                    f"libérés ({memoire_avant / 2 ** 20:.2f} Mo -> {memoire_apres / 2 ** 20:.2f} Mo)")
+    logger.info(f"Optimisation des types: {memoire_totale / 2 ** 20:.2f} Mo libérés au total, "
+                f"{df.memory_usage(index=True, deep=True).sum() / 2 ** 20:.2f} Mo occupés par le df")
+    return df
+
+
+def signature_fichiers(chemins: list, empreinte_contenu: bool = False) -> str:
+    """
+    Signature d'une liste de fichiers d'entrée: chemin, taille et date de modification de chacun, ou empreinte de leur
+    contenu si empreinte_contenu vaut True (fichiers réécrits à l'identique à chaque exécution).
+
+    Retour:
+        str
+    """
+    signatures = []
+    for chemin in chemins:
+        if os.path.exists(chemin) and empreinte_contenu:
+            empreinte = hashlib.blake2b(digest_size=16)
+            with open(chemin, 'rb') as f:
+                for bloc in iter(lambda: f.read(2 ** 20), b""):
+                    empreinte.update(bloc)
+            signatures += [f"{chemin}:{empreinte.hexdigest()}"]
+        elif os.path.exists(chemin):
+            statistiques = os.stat(chemin)
+            signatures += [f"{chemin}:{statistiques.st_size}:{statistiques.st_mtime_ns}"]
+        else:
+            signatures += [f"{chemin}:absent"]
+    return "|".join(signatures)
+
+
+def signature_code(objet, dossier_projet: str = None, vus: set = None) -> str:
+    """
+    Texte représentant une étape (fonction DataFrame -> DataFrame, éventuellement partial) et tout ce dont son
+    résultat dépend: source de la fonction, arguments du partial, et récursivement les fonctions et constantes
+    globales qu'elle utilise (configuration chargée des fichiers json, listes de règles...), y compris celles des
+    autres modules du projet appelées sous la forme module.fonction. Les fonctions des librairies sont représentées
+    par leur nom.
+    Pour les dictionnaires globaux (configuration), seules les clefs lues par la fonction sont prises en compte (cf
+    acces_dictionnaires): modifier une autre clef de var_glob.json n'invalide pas le point de reprise de l'étape.
+
+    Retour:
+        str
+    """
+    vus = set() if vus is None else vus
+    if isinstance(objet, partial):
+        return (f"partial({signature_code(objet.func, dossier_projet, vus)}, "
+                f"{signature_code(list(objet.args), dossier_projet, vus)}, "
+                f"{signature_code(objet.keywords, dossier_projet, vus)})")
+    if isinstance(objet, (list, tuple)):
+        return "[" + ", ".join(signature_code(element, dossier_projet, vus) for element in objet) + "]"
+    if isinstance(objet, dict):
+        return "{" + ", ".join(f"{cle!r}: {signature_code(valeur, dossier_projet, vus)}"
+                               for cle, valeur in objet.items()) + "}"
+    objet = getattr(objet, "__wrapped__", objet)  # fonctions décorées (lru_cache)
+    if not isinstance(objet, types.FunctionType):
+        return repr(objet)
+    nom = f"{objet.__module__}.{objet.__qualname__}"
+    dossier_projet = dossier_projet or os.path.dirname(os.path.abspath(inspect.getfile(objet)))
+    if nom in vus or os.path.dirname(os.path.abspath(inspect.getfile(objet))) != dossier_projet:
+        return nom
+    vus.add(nom)
+
+    # Noms utilisés par la fonction et ses fonctions imbriquées (lambdas, compréhensions)
+    noms = set()
+    codes = [objet.__code__]
+    while codes:
+        code = codes.pop()
+        noms.update(code.co_names)
+        codes += [constante for constante in code.co_consts if isinstance(constante, types.CodeType)]
+    modules_projet = [valeur for valeur in objet.__globals__.values() if isinstance(valeur, types.ModuleType)
+                      and os.path.dirname(os.path.abspath(getattr(valeur, "__file__", None) or "")) == dossier_projet]
+    acces = acces_dictionnaires(objet)
+    dependances = []
+    for nom_global in sorted(noms):
+        if nom_global in objet.__globals__:
+            valeur = objet.__globals__[nom_global]
+            if isinstance(valeur, dict) and acces.get(nom_global) and () not in acces[nom_global]:
+                # Seules les clefs lues sont prises en compte
+                for chemin in sorted(acces[nom_global]):
+                    dependances += [f"{nom_global}{list(chemin)}="
+                                    f"{signature_code(valeur_chemin(valeur, chemin), dossier_projet, vus)}"]
+            elif not isinstance(valeur, (types.ModuleType, type)):
+                dependances += [f"{nom_global}={signature_code(valeur, dossier_projet, vus)}"]
+        for module in modules_projet:
+            valeur = getattr(module, nom_global, None)
+            if isinstance(valeur, types.FunctionType):
+                dependances += [signature_code(valeur, dossier_projet, vus)]
+    return inspect.getsource(objet) + "\n".join(dependances)
+
+
+def acces_dictionnaires(objet: types.FunctionType) -> dict:
+    """
+    Clefs lues par une fonction dans les noms qu'elle utilise: {nom: {chemin de clefs}}, ex: conf_glob["nettoyage"]
+    ["nb_processus"] donne {"conf_glob": {("nettoyage", "nb_processus")}}. Les accès par [clef constante] et
+    .get(clef constante) sont suivis. Un nom utilisé autrement (passé en argument, clef variable...) a le chemin vide
+    (), c'est à dire tout le dictionnaire, ou le chemin déjà parcouru.
+
+    Retour:
+        dict
+    """
+    try:
+        arbre = ast.parse(textwrap.dedent(inspect.getsource(objet)))
+    except (OSError, SyntaxError):
+        return {}
+    parents = {enfant: noeud for noeud in ast.walk(arbre) for enfant in ast.iter_child_nodes(noeud)}
+
+    def clef_constante(noeud):
+        noeud = getattr(noeud, "value", noeud) if type(noeud).__name__ == "Index" else noeud  # Python < 3.9
+        return noeud.value if isinstance(noeud, ast.Constant) and isinstance(noeud.value, (str, int)) else None
+
+    acces = {}
+    for noeud in ast.walk(arbre):
+        if not (isinstance(noeud, ast.Name) and isinstance(noeud.ctx, ast.Load)):
+            continue
+        chemin = []
+        courant = noeud
+        while True:
+            parent = parents.get(courant)
+            if isinstance(parent, ast.Subscript) and parent.value is courant and \
+                    clef_constante(parent.slice) is not None:
+                chemin += [clef_constante(parent.slice)]
+                courant = parent
+            elif isinstance(parent, ast.Attribute) and parent.attr == "get" and \
+                    isinstance(parents.get(parent), ast.Call) and parents[parent].args and \
+                    clef_constante(parents[parent].args[0]) is not None:
+                chemin += [clef_constante(parents[parent].args[0])]
+                courant = parents[parent]
+            else:
+                break
+        acces.setdefault(noeud.id, set()).add(tuple(chemin))
+    return acces
+
+
+def valeur_chemin(valeur, chemin: tuple):
+    """
+    Valeur d'un dictionnaire imbriqué au bout d'un chemin de clefs (cf acces_dictionnaires), None si absente
+    """
+    for clef in chemin:
+        if not isinstance(valeur, dict) or clef not in valeur:
+            return None
+        valeur = valeur[clef]
+    return valeur
+
+
+def nom_etape(etape) -> str:
+    """
+    Nom d'une étape pour les logs
+
+    Retour:
+        str
+    """
+    if isinstance(etape, partial):
+        return nom_etape(etape.func)
+    return getattr(etape, "__name__", repr(etape))
+
+
+def eviction_points_de_reprise(dossier: str, taille_max_mo: float, age_max_jours: float):
+    """
+    Suppression des points de reprise plus anciens que age_max_jours, puis des moins récemment utilisés tant que le
+    dossier dépasse taille_max_mo.
+    """
+    fichiers = [os.path.join(dossier, nom) for nom in os.listdir(dossier) if nom.endswith(".pkl")]
+    fichiers = sorted(fichiers, key=os.path.getmtime)
+    maintenant = time.time()
+    taille_totale = sum(os.path.getsize(fichier) for fichier in fichiers)
+    for fichier in fichiers:
+        trop_ancien = maintenant - os.path.getmtime(fichier) > age_max_jours * 86400
+        if trop_ancien or taille_totale > taille_max_mo * 2 ** 20:
+            taille_totale -= os.path.getsize(fichier)
+            os.remove(fichier)
+            logger.info(f"Point de reprise supprimé: {fichier}")
+
+
+def memoire_residente() -> int:
+    """
+    Mémoire résidente (RSS) actuelle du processus en octets, lue dans /proc/self/statm (Linux).
+    Renvoie None si l'information n'est pas disponible.
+
+    Retour:
+        int
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def temps_cpu_enfants() -> float:
+    """
+    Temps CPU (utilisateur et système) cumulé des processus enfants terminés, en secondes: processus de
+    nettoyage.execution_partitionnee, attendus à la fin de chaque étape. Renvoie None si l'information n'est pas
+    disponible (module resource absent sous Windows).
+
+    Retour:
+        float
+    """
+    if resource is None:
+        return None
+    utilisation = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return utilisation.ru_utime + utilisation.ru_stime
+
+
+def memoire_df(df: pd.DataFrame) -> float:
+    """
+    Mémoire occupée par le df (index et contenu des colonnes object compris), en Mo
+
+    Retour:
+        float
+    """
+    if df is None:
+        return 0.0
+    return round(df.memory_usage(index=True, deep=True).sum() / 2 ** 20, 3)
+
+
+def execution_mesuree(etape, df: pd.DataFrame, mesures: list, memoire_entree: float = None) -> pd.DataFrame:
+    """
+    Exécute une étape et ajoute à la liste mesures ses performances: durée, temps CPU du processus principal et des
+    processus enfants (cf temps_cpu_enfants, si nb_processus > 1), pic de mémoire tracée par tracemalloc (si actif),
+    variation de la mémoire résidente (processus principal), nombre de lignes/colonnes et mémoire du df en entrée et
+    en sortie. Si mesures vaut None, l'étape est simplement exécutée.
+
+    Retour:
+        pd.DataFrame
+    """
+    if mesures is None:
+        return etape(df)
+    mesure = {"etape": nom_etape(etape),
+              "lignes_entree": 0 if df is None else df.shape[0],
+              "colonnes_entree": 0 if df is None else df.shape[1],
+              "memoire_df_entree_mo": memoire_df(df) if memoire_entree is None else memoire_entree}
+    if tracemalloc.is_tracing() and hasattr(tracemalloc, "reset_peak"):
+        # Python >= 3.9: pic propre à l'étape, sinon pic depuis le début du traçage
+        tracemalloc.reset_peak()
+    rss_avant = memoire_residente()
+    debut, debut_cpu, debut_cpu_enfants = time.perf_counter(), time.process_time(), temps_cpu_enfants()
+    df = etape(df)
+    mesure["duree_s"] = round(time.perf_counter() - debut, 3)
+    mesure["duree_cpu_s"] = round(time.process_time() - debut_cpu, 3)
+    mesure["duree_cpu_enfants_s"] = (None if debut_cpu_enfants is None
+                                     else round(temps_cpu_enfants() - debut_cpu_enfants, 3))
+    rss_apres = memoire_residente()
+    mesure["delta_rss_mo"] = None if rss_avant is None else round((rss_apres - rss_avant) / 2 ** 20, 3)
+    mesure["pic_memoire_tracee_mo"] = (round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 3)
+                                       if tracemalloc.is_tracing() else None)
+    mesure.update({"lignes_sortie": df.shape[0], "colonnes_sortie": df.shape[1],
+                   "memoire_df_sortie_mo": memoire_df(df)})
+    mesures += [mesure]
+    return df
+
+
+def ecriture_rapport_performances(mesures: list, nom_chaine: str, debut: str, conf_rapport: dict):
+    """
+    Ecriture des mesures des étapes d'une chaîne (cf execution_mesuree) dans un rapport json:
+    <dossier>/<date de début>_<nom_chaine>.json
+    """
+    os.makedirs(conf_rapport["dossier"], exist_ok=True)
+    chemin = os.path.join(conf_rapport["dossier"], f"{debut.replace(':', '-')}_{nom_chaine}.json")
+    rapport = {"chaine": nom_chaine, "debut": debut, "fin": datetime.now().isoformat(timespec="seconds"),
+               "duree_s": round(sum(mesure.get("duree_s", 0) for mesure in mesures), 3),
+               "etapes": mesures}
+    with open(chemin, 'w', encoding='utf-8') as f:
+        json.dump(rapport, f, indent=4, ensure_ascii=False)
+    logger.info(f"Rapport de performances écrit: {chemin}")
+
+
+def execution_etapes_avec_reprise(df: pd.DataFrame, etapes: list, cle_initiale: str, conf_reprise: dict,
+                                  actif: bool = True, conf_rapport: dict = None,
+                                  nom_chaine: str = "etapes") -> pd.DataFrame:
+    """
+    Applique successivement les étapes au df (comme une chaîne de df.pipe), en enregistrant le résultat de chaque étape
+    (point de reprise) dans le dossier de conf_reprise (clef points_de_reprise de var_glob.json).
+    La clef du point de reprise d'une étape est l'empreinte de la clef de l'étape précédente (la première dépend de
+    cle_initiale, qui doit identifier les données d'entrée) et de la signature de l'étape (cf signature_code): elle
+    identifie donc les données en entrée de l'étape, son code et la configuration utilisée.
+    A la relance, l'exécution reprend après la dernière étape dont le point de reprise existe.
+    Les étapes ne sont plus exécutées dès que le df est vide.
+    Si conf_rapport est actif (clef rapport_performances de var_glob.json), les performances de chaque étape sont
+    mesurées et écrites dans un rapport json (cf execution_mesuree).
+
+    Retour:
+        pd.DataFrame
+    """
+    reprise = actif and conf_reprise["actif"]
+    mesures = [] if conf_rapport and conf_rapport["actif"] else None
+    debut_chaine = datetime.now().isoformat(timespec="seconds")
+    if mesures is not None and conf_rapport["tracemalloc"] and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    chemins = [None] * len(etapes)
+    debut = 0
+    if reprise:
+        dossier = conf_reprise["dossier"]
+        os.makedirs(dossier, exist_ok=True)
+        cle = cle_initiale
+        for indice, etape in enumerate(etapes):
+            cle = hashlib.blake2b((cle + signature_code(etape)).encode("utf-8"), digest_size=16).hexdigest()
+            chemins[indice] = os.path.join(dossier, f"{cle}.pkl")
+        for indice in reversed(range(len(etapes))):
+            if os.path.exists(chemins[indice]):
+                logger.info(f"Reprise après l'étape {nom_etape(etapes[indice])} ({chemins[indice]})")
+                df = pd.read_pickle(chemins[indice])
+                os.utime(chemins[indice])
+                debut = indice + 1
+                if mesures is not None:
+                    mesures += [{"etape": nom_etape(etape), "reprise": True} for etape in etapes[:debut]]
+                break
+
+    memoire_entree = None
+    for etape, chemin in zip(etapes[debut:], chemins[debut:]):
+        if df is not None and df.empty:
+            break
+        df = execution_mesuree(etape, df, mesures, memoire_entree)
+        if mesures is not None:
+            memoire_entree = mesures[-1]["memoire_df_sortie_mo"]
+        if reprise:
+            df.to_pickle(chemin + ".tmp")
+            os.replace(chemin + ".tmp", chemin)
+            logger.info(f"Point de reprise de l'étape {nom_etape(etape)} enregistré")
+    if reprise:
+        eviction_points_de_reprise(dossier, conf_reprise["taille_max_mo"], conf_reprise["age_max_jours"])
+    if mesures is not None:
+        ecriture_rapport_performances(mesures, nom_chaine, debut_chaine, conf_rapport)
+    return df